@@ -13,7 +13,11 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PIL import Image
 from map import costmap
 from map.costmap import Vehicle, Map
 
@@ -29,31 +33,38 @@ class ploter:
         if fig_id == None:
             fig_id = 1
         plt.figure(fig_id)
+        ploter.draw_map(plt.gca(), map)
+        plt.draw()
+        print("Finished plotting obstacles")
+
+    @staticmethod
+    def draw_map(ax, map:Map):
+        '''
+        draw the obstacles, the start and the goal on the axes
+        '''
         # create original map
         ## create obstacles
         for j in range(0, map.case.obs_num):
-            plt.fill(map.case.obs[j][:, 0], map.case.obs[j][:, 1], facecolor = 'k', alpha = 0.5)
+            ax.fill(map.case.obs[j][:, 0], map.case.obs[j][:, 1], facecolor = 'k', alpha = 0.5)
         
         ## create start vahicle and terminate vehicle
         temp = map.case.vehicle.create_polygon(map.case.x0, map.case.y0, map.case.theta0)
-        plt.plot(temp[:, 0], temp[:, 1], linestyle='--', linewidth = 0.4, color = 'green')
+        ax.plot(temp[:, 0], temp[:, 1], linestyle='--', linewidth = 0.4, color = 'green')
         temp = map.case.vehicle.create_polygon(map.case.xf, map.case.yf, map.case.thetaf)
-        plt.plot(temp[:, 0], temp[:, 1], linestyle='--', linewidth = 0.4, color = 'red')
+        ax.plot(temp[:, 0], temp[:, 1], linestyle='--', linewidth = 0.4, color = 'red')
 
         ## create arrow
-        plt.arrow(map.case.x0, map.case.y0, np.cos(map.case.theta0), np.sin(map.case.theta0), width=0.2, color = "gold")
-        plt.arrow(map.case.xf, map.case.yf, np.cos(map.case.thetaf), np.sin(map.case.thetaf), width=0.2, color = "gold")
+        ax.arrow(map.case.x0, map.case.y0, np.cos(map.case.theta0), np.sin(map.case.theta0), width=0.2, color = "gold")
+        ax.arrow(map.case.xf, map.case.yf, np.cos(map.case.thetaf), np.sin(map.case.thetaf), width=0.2, color = "gold")
 
         ## plot goal
-        plt.plot(np.float64(map.case.xf),np.float64(map.case.yf),'o',color='green')
+        ax.plot(np.float64(map.case.xf),np.float64(map.case.yf),'o',color='green')
 
-        plt.title("Hybrid A Star Path")
-        plt.xlim(map.boundary[0], map.boundary[1])
-        plt.ylim(map.boundary[2], map.boundary[3])
-        plt.gca().set_aspect('equal', adjustable = 'box')
-        plt.gca().set_axisbelow(True)
-        plt.draw()
-        print("Finished plotting obstacles")
+        ax.set_title("Hybrid A Star Path")
+        ax.set_xlim(map.boundary[0], map.boundary[1])
+        ax.set_ylim(map.boundary[2], map.boundary[3])
+        ax.set_aspect('equal', adjustable = 'box')
+        ax.set_axisbelow(True)
 
     # @staticmethod
     # def plot_init():
@@ -87,22 +98,18 @@ class ploter:
 
     @staticmethod
     def plot_final_path(path, color='green', show_car=False, label:str=None):
-        x,y=[],[]
-        v = Vehicle()
+        '''
+        draw the path as one line and the vehicle outlines as one collection
+        '''
         fig1 = plt.figure(1, dpi=600, figsize=(16,12))
-        
-        for i in range(len(path)):
-            x.append(path[i][0])
-            y.append(path[i][1])
-            if i == 0:
-                ploter.plot_curve(x,y,color,label)
-            else:
-                ploter.plot_curve(x,y,color)
-            if show_car:
-                points = v.create_polygon(path[i][0], path[i][1], path[i][2])
-                plt.plot(points[:, 0], points[:, 1], linestyle='-', linewidth = 0.4, color = color)
-            plt.draw()
-            plt.pause(0.1)
+        path = np.array([p[:3] for p in path], dtype=np.float64)
+        if len(path) == 0:
+            return
+        plt.plot(path[:, 0], path[:, 1], '-', linewidth=0.8, color=color, label=label)
+        if show_car:
+            outlines = car_outlines(path)
+            plt.gca().add_collection(LineCollection(outlines, linestyle='-', linewidth=0.4, color=color))
+        plt.draw()
         
         # plt.show()
 
@@ -130,25 +137,82 @@ class ploter:
         plt.draw()
     
     @staticmethod
-    def save_gif(path, color='green', show_car=False, save_gif_name=None, map=None):
-        fig = plt.figure(2, dpi=200, figsize=(6,4))
-        ploter.plot_obstacles(map=map, fig_id=2)
-        x,y=[],[]
-        v = Vehicle()
-        imgs_list = []
-        for i in range(len(path)):
-            x.append(path[i][0])
-            y.append(path[i][1])
-            path_imgs = plt.plot(x,y,'-',linewidth=0.8,color=color)
-            if show_car:
-                points = v.create_polygon(path[i][0], path[i][1], path[i][2])
-                car_imgs = plt.plot(points[:, 0], points[:, 1], linestyle='-', linewidth = 0.4, color = color)
-                imgs_list.append(car_imgs)
-            plt.draw()
-            plt.pause(0.1)
-        
-        ani = animation.ArtistAnimation(fig=fig, artists=imgs_list, interval=10,repeat_delay=1000)
-        ani.save(save_gif_name, writer='pillow', fps=30)
-        plt.close(fig)
-
-    
\ No newline at end of file
+    def save_gif(path, color='green', show_car=False, save_gif_name=None, map=None,
+                 workers=0):
+        '''
+        render the gif off screen, each frame extends the path line and
+        moves the vehicle outline
+        param: workers > 1 renders the frames in a process pool
+        '''
+        path = np.array([p[:3] for p in path], dtype=np.float64)
+        frame_num = len(path)
+        if frame_num == 0:
+            return
+        # the last frame contains every color, all frames share its palette
+        last_frame = render_frames(map, path, color, show_car, [frame_num - 1])[0]
+        palette = last_frame.quantize()
+        if workers > 1 and frame_num > workers:
+            chunks = np.array_split(np.arange(frame_num), workers)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(render_frames, [map] * workers, [path] * workers,
+                                       [color] * workers, [show_car] * workers, chunks,
+                                       [palette] * workers)
+                images = [image for result in results for image in result]
+        else:
+            images = render_frames(map, path, color, show_car, range(frame_num), palette)
+
+        images[0].save(save_gif_name, save_all=True, append_images=images[1:],
+                       duration=1000 / 30, loop=0, optimize=False)
+
+
+def car_outlines(path):
+    '''
+    param: path is an array of (x, y, theta)
+    return: the vehicle outline at each pose, shape (n, 5, 2)
+    '''
+    v = Vehicle()
+    corners = np.array([
+        [-v.lr, -v.lb / 2],
+        [v.lf + v.lw, -v.lb / 2],
+        [v.lf + v.lw, v.lb / 2],
+        [-v.lr, v.lb / 2],
+        [-v.lr, -v.lb / 2],
+    ])
+    cos_theta = np.cos(path[:, 2])[:, None]
+    sin_theta = np.sin(path[:, 2])[:, None]
+    x = path[:, 0:1] + cos_theta * corners[:, 0] - sin_theta * corners[:, 1]
+    y = path[:, 1:2] + sin_theta * corners[:, 0] + cos_theta * corners[:, 1]
+    return np.stack([x, y], axis=-1)
+
+
+def render_frames(map, path, color, show_car, frame_index, palette=None):
+    '''
+    draw the gif frames on an Agg canvas, the map is drawn once and the
+    frames only blit the path line and the vehicle outline over it
+    param: palette is a palette image, the frames are quantized to it
+    return: rgb images of the frames in frame_index
+    '''
+    fig = Figure(dpi=200, figsize=(6,4))
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ploter.draw_map(ax, map)
+    path_line, = ax.plot([], [], '-', linewidth=0.8, color=color, animated=True)
+    car_line, = ax.plot([], [], '-', linewidth=0.4, color=color, animated=True)
+    canvas.draw()
+    background = canvas.copy_from_bbox(ax.bbox)
+    outlines = car_outlines(path) if show_car else None
+
+    frames = []
+    for i in frame_index:
+        canvas.restore_region(background)
+        path_line.set_data(path[:i + 1, 0], path[:i + 1, 1])
+        ax.draw_artist(path_line)
+        if show_car:
+            car_line.set_data(outlines[i, :, 0], outlines[i, :, 1])
+            ax.draw_artist(car_line)
+        canvas.blit(ax.bbox)
+        frame = Image.fromarray(np.asarray(canvas.buffer_rgba())).convert('RGB')
+        if palette is not None:
+            frame = frame.quantize(palette=palette, dither=Image.Dither.NONE)
+        frames.append(frame)
+    return frames
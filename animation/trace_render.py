@@ -0,0 +1,99 @@
+'''
+Description: draw a recorded exploration trace after the search
+
+Each kind of event is one scatter, so the cost does not depend on the
+number of explored nodes. The gif reveals the events by expansion step.
+
+usage: python -m animation.trace_render --case_name Case1 --gif
+'''
+
+
+import argparse
+import os
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from animation.animation import ploter
+from map.costmap import Map
+
+# kind of events: marker, color, size
+trace_styles = {
+    'inserted': ('.', 'grey', 1),
+    'expanded': ('o', 'r', 2),
+    'goals': ('o', 'g', 2),
+    'collisions': ('x', 'b', 4),
+}
+
+
+def load_trace(file: str) -> dict:
+    with np.load(file) as data:
+        return {name: data[name] for name in trace_styles}
+
+
+def draw_trace(trace: dict, park_map: Map, fig_id=1):
+    '''
+    draw the obstacles and all the events of the trace
+    return: the figure and the scatter of each kind of events
+    '''
+    ploter.plot_obstacles(map=park_map, fig_id=fig_id)
+    fig = plt.figure(fig_id)
+    scatters = {}
+    for name, (marker, color, size) in trace_styles.items():
+        events = trace[name]
+        scatters[name] = plt.scatter(events[:, 0], events[:, 1], s=size,
+                                     marker=marker, color=color, label=name)
+    plt.title('Exploration: %d nodes expanded' % len(trace['expanded']))
+    return fig, scatters
+
+
+def render_trace(trace_file: str, park_map: Map,
+                 save_png: str = None, save_gif: str = None,
+                 frame_num: int = 50) -> None:
+    '''
+    param: trace_file is saved by RecordingSink.save,
+           frame_num is the number of gif frames
+    '''
+    trace = load_trace(trace_file)
+    fig, scatters = draw_trace(trace, park_map)
+    if save_png is not None:
+        plt.savefig(save_png, dpi=300)
+
+    if save_gif is not None:
+        step_num = len(trace['expanded'])
+        frame_steps = np.linspace(0, step_num, max(frame_num, 1)).astype(np.int64)
+
+        def update(frame):
+            for name, scatter in scatters.items():
+                events = trace[name]
+                # the steps are recorded in order
+                end = np.searchsorted(events[:, 3], frame_steps[frame], side='right')
+                scatter.set_offsets(events[:end, :2])
+            return list(scatters.values())
+
+        ani = animation.FuncAnimation(fig, update, frames=len(frame_steps),
+                                      interval=100, blit=True)
+        ani.save(save_gif, writer='pillow', fps=10)
+
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    matplotlib.use('Agg')
+    from config import read_config
+
+    parser = argparse.ArgumentParser(description='exploration trace')
+    parser.add_argument("--config_name", type=str, default="config")
+    parser.add_argument("--case_name", type=str, default="Case1")
+    parser.add_argument("--gif", action="store_true")
+    args = parser.parse_args()
+
+    config = read_config.read_config(config_name=args.config_name)
+    file = os.path.join(config['Benchmark_path'], args.case_name + '.csv')
+    park_map = Map(file=file, discrete_size=config['map_discrete_size'],
+                   fill_obstacle=config['map_fill_obstacle'])
+
+    name = os.path.join(config['pic_path'], args.case_name + '_trace')
+    render_trace(trace_file=name + '.npz', park_map=park_map,
+                 save_png=name + '.png',
+                 save_gif=name + '.gif' if args.gif else None)
@@ -0,0 +1,144 @@
+'''
+Description: visualization sinks for the searching process
+
+The planner reports what it is doing to a sink:
+    NullSink drops everything (no rendering cost),
+    RecordingSink keeps the events in a compact trace for later rendering,
+    LiveSink draws them with matplotlib while searching (slow).
+'''
+
+
+import numpy as np
+from map.costmap import Map
+
+
+class NullSink:
+    '''
+    ignore all events
+    '''
+
+    def plot_obstacles(self, map: Map) -> None:
+        pass
+
+    def plot_goal_node(self, goal_node) -> None:
+        pass
+
+    def plot_current_node(self, current_node) -> None:
+        pass
+
+    def plot_child_node(self, child_node) -> None:
+        pass
+
+    def plot_collision_p(self, x, y, theta, map: Map) -> None:
+        pass
+
+
+class TraceBuffer:
+    '''
+    rows of [x, y, theta, step] appended into fixed size chunks
+    '''
+
+    def __init__(self, chunk_size: int = 4096) -> None:
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.current = np.empty((chunk_size, 4))
+        self.size = 0
+
+    def append(self, x, y, theta, step) -> None:
+        if self.size == self.chunk_size:
+            self.chunks.append(self.current)
+            self.current = np.empty((self.chunk_size, 4))
+            self.size = 0
+        self.current[self.size] = (x, y, theta, step)
+        self.size += 1
+
+    def __len__(self) -> int:
+        return len(self.chunks) * self.chunk_size + self.size
+
+    def to_array(self):
+        '''
+        return: all rows, shape (n, 4)
+        '''
+        return np.concatenate(self.chunks + [self.current[:self.size]])
+
+
+class RecordingSink(NullSink):
+    '''
+    record the events into a trace, each row is [x, y, theta, step],
+    step is the number of nodes expanded before the event
+    '''
+
+    trace_arrays = ('goals', 'expanded', 'inserted', 'collisions')
+
+    def __init__(self, chunk_size: int = 4096) -> None:
+        self.step = 0
+        self.goals = TraceBuffer(chunk_size)
+        self.expanded = TraceBuffer(chunk_size)
+        self.inserted = TraceBuffer(chunk_size)
+        self.collisions = TraceBuffer(chunk_size)
+
+    def plot_goal_node(self, goal_node) -> None:
+        self.goals.append(goal_node.x, goal_node.y, goal_node.theta, self.step)
+
+    def plot_current_node(self, current_node) -> None:
+        self.expanded.append(current_node.x, current_node.y, current_node.theta, self.step)
+        self.step += 1
+
+    def plot_child_node(self, child_node) -> None:
+        self.inserted.append(child_node.x, child_node.y, child_node.theta, self.step)
+
+    def plot_collision_p(self, x, y, theta, map: Map) -> None:
+        self.collisions.append(x, y, theta, self.step)
+
+    def trace(self) -> dict:
+        '''
+        return: the recorded arrays by name
+        '''
+        return {name: getattr(self, name).to_array() for name in self.trace_arrays}
+
+    def save(self, file: str) -> None:
+        '''
+        save the trace into a npz file, animation/trace_render.py draws it
+        '''
+        np.savez_compressed(file, **self.trace())
+
+
+class LiveSink(NullSink):
+    '''
+    draw the events on the matplotlib figure immediately
+    '''
+
+    def __init__(self, draw_collision: bool = False) -> None:
+        # matplotlib is only loaded when live drawing is used
+        from animation.animation import ploter
+        self.ploter = ploter
+        self.draw_collision = draw_collision
+
+    def plot_obstacles(self, map: Map) -> None:
+        self.ploter.plot_obstacles(map)
+
+    def plot_goal_node(self, goal_node) -> None:
+        self.ploter.plot_goal_node(goal_node)
+
+    def plot_current_node(self, current_node) -> None:
+        self.ploter.plot_current_node(current_node)
+
+    def plot_child_node(self, child_node) -> None:
+        self.ploter.plot_child_node(child_node)
+
+    def plot_collision_p(self, x, y, theta, map: Map) -> None:
+        if self.draw_collision:
+            self.ploter.plot_collision_p(x, y, theta, map)
+
+
+def create_sink(name: str, draw_collision: bool = False):
+    '''
+    param: name is 'none', 'record' or 'live',
+           draw_collision only affects the live drawing
+    '''
+    if name == 'live':
+        return LiveSink(draw_collision)
+    elif name == 'record':
+        return RecordingSink()
+    else:
+        return NullSink()
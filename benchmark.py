@@ -0,0 +1,134 @@
+'''
+Description: solve the benchmark cases in parallel without plotting and
+             write the statistics of every case into a csv and a json report
+
+usage: python benchmark.py --workers 8 --cases "Case1*.csv"
+'''
+
+
+import matplotlib
+matplotlib.use('Agg')
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import contextlib
+import argparse
+import logging
+import signal
+import glob
+import json
+import time
+import csv
+import os
+
+from config import read_config
+
+
+report_fields = ['case', 'success', 'path_found', 'collision', 'error',
+                 'total_time', 'map_time', 'plan_time', 'optimize_time',
+                 'expanded_nodes', 'generated_nodes', 'rs_cache_hit', 'rs_cache_miss',
+                 'path_points', 'optimal_tf']
+
+
+class CaseTimeout(Exception):
+    pass
+
+
+def raise_timeout(signum, frame):
+    raise CaseTimeout()
+
+
+def run_case(file, config, timeout, draw):
+    '''
+    solve one case in a worker process, the planner output is discarded
+    return: the statistics of the case
+    '''
+    case_name = os.path.splitext(os.path.basename(file))[0]
+    result = {'case': case_name, 'success': False}
+    # SIGALRM is not available on windows, the cases are not limited there
+    use_alarm = timeout > 0 and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.alarm(timeout)
+    start_time = time.time()
+    error = None
+    try:
+        # import outside the redirection, pyomo keeps the stream for its logging
+        import main
+        logging.getLogger('pyomo').setLevel(logging.ERROR)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            main.solve(file=file, config=config, case_name=case_name,
+                       draw=draw, result=result)
+    except CaseTimeout:
+        error = 'timeout after %d s' % timeout
+    except Exception as e:
+        error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+    result['error'] = error
+    result['total_time'] = time.time() - start_time
+    return result
+
+
+def case_key(file):
+    '''
+    sort Case2 before Case10
+    '''
+    name = os.path.splitext(os.path.basename(file))[0]
+    digits = ''.join(c for c in name if c.isdigit())
+    return (name.rstrip('0123456789'), int(digits) if digits else -1, name)
+
+
+def write_report(results, report):
+    report_path = os.path.dirname(report)
+    if report_path and not os.path.exists(report_path):
+        os.makedirs(report_path)
+    with open(report + '.csv', 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=report_fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    with open(report + '.json', 'w') as f:
+        json.dump(results, f, indent=2, default=float)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark')
+    parser.add_argument("--config_name", type=str, default="config")
+    parser.add_argument("--cases", type=str, default="*.csv",
+                        help="glob of the case files in the benchmark folder")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--timeout", type=int, default=600,
+                        help="seconds allowed for each case, 0 for no limit")
+    parser.add_argument("--report", type=str, default="./benchmark/report",
+                        help="report file without the extension")
+    parser.add_argument("--draw", action="store_true",
+                        help="save the figures and the gif of each case")
+    args = parser.parse_args()
+
+    config = read_config.read_config(config_name=args.config_name)
+    # headless: no drawing while searching
+    config['visual_sink'] = 'none'
+    config['draw_collision'] = False
+    config['gif_workers'] = 0
+
+    files = sorted(glob.glob(os.path.join(config['Benchmark_path'], args.cases)), key=case_key)
+    print('Solving %d cases with %d workers' % (len(files), args.workers))
+
+    start_time = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(run_case, file, config, args.timeout, args.draw)
+                   for file in files]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print('%-8s %-7s %7.1f s  %s' % (result['case'],
+                                             'solved' if result['success'] else 'failed',
+                                             result['total_time'],
+                                             result['error'] or ''))
+
+    results.sort(key=lambda result: case_key(result['case']))
+    write_report(results, args.report)
+    solved = sum(result['success'] for result in results)
+    print('Solved %d of %d cases in %.1f s, report: %s.csv/.json' %
+          (solved, len(results), time.time() - start_time, args.report))
@@ -12,8 +12,10 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 
 from abc import abstractmethod
 from typing import Tuple
+import math
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy import signal
 from map.costmap import Map, Vehicle
 
 
@@ -45,37 +47,94 @@ class collision_checker:
         note: these points have expanded
         '''
 
-        # create AABB square
-        x_max = max(vehicle_boundary[:, 0])
-        x_min = min(vehicle_boundary[:, 0])
-        y_max = max(vehicle_boundary[:, 1])
-        y_min = min(vehicle_boundary[:, 1])
-
-        # get obstacle position
-        obstacle_index = np.where(self.map.cost_map == 255)
-        obstacle_position_x = self.map.map_position[0][obstacle_index[0]]
-        obstacle_position_y = self.map.map_position[1][obstacle_index[1]]
+        # create AABB square, the boundary points are (2, 1) arrays
+        x_max = float(np.max(vehicle_boundary[:, 0]))
+        x_min = float(np.min(vehicle_boundary[:, 0]))
+        y_max = float(np.max(vehicle_boundary[:, 1]))
+        y_min = float(np.min(vehicle_boundary[:, 1]))
 
         # find those obstacles point in the AABB square
-        near_x_position = obstacle_position_x[np.where(
-            (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-        near_y_position = obstacle_position_y[np.where(
-            (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-
-        # determine y
-        near_obstacle_x = near_x_position[np.where(
-            (near_y_position >= y_min) & (near_y_position <= y_max))]
-        near_obstacle_y = near_y_position[np.where(
-            (near_y_position >= y_min) & (near_y_position <= y_max))]
+        near_obstacle_x, near_obstacle_y = self.map.query_aabb(
+            x_min=x_min, x_max=x_max, y_min=y_min, y_max=y_max)
 
         near_obstacle_range = [near_obstacle_x, near_obstacle_y]
 
         return near_obstacle_range, vehicle_boundary
 
+    def get_obstacle_points(self, x_min, x_max, y_min, y_max) -> Tuple[np.array, np.array]:
+        '''
+        return the x and y of the obstacle points in the AABB square
+        '''
+        return self.map.query_aabb(x_min=x_min, x_max=x_max,
+                                   y_min=y_min, y_max=y_max)
+
     @abstractmethod
     def check(self, node_x, node_y, theta) -> bool:
         pass
 
+    def check_many(self, poses: np.ndarray) -> np.ndarray:
+        '''
+        check a batch of poses
+        poses: (N, 3) array of x, y, theta
+        return: (N,) bool array, true means collision
+        '''
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        collision = [self.check(node_x=x, node_y=y, theta=theta)
+                     for x, y, theta in poses]
+
+        return np.array(collision, dtype=bool)
+
+    def check_trajectory(self, poses, order: str = None) -> Tuple[bool, list]:
+        '''
+        check the poses of a trajectory and stop at the first collision
+        poses: (N, 3) array of x, y, theta
+        order: 'sequential' checks from the start of the trajectory,
+               'bisection' checks the end first and then the midpoints of
+               the unchecked parts, 'clearance' checks the poses closest to
+               the obstacles first, the default is config['trajectory_check_order']
+        return: collision, the colliding pose [x, y, theta] (None if no collision)
+        Note: the poses are checked in batches growing from 8 up to 64, the
+              returned pose is the first collision found in the checking order
+        '''
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        if len(poses) == 0:
+            return False, None
+        if order is None:
+            order = self.config['trajectory_check_order']
+        check_order = self.trajectory_order(poses, order)
+
+        start = 0
+        batch_size = 8
+        while start < len(check_order):
+            index = check_order[start:start + batch_size]
+            collision = self.check_many(poses[index])
+            if np.any(collision):
+                return True, poses[index[np.argmax(collision)]].tolist()
+            start += batch_size
+            batch_size = min(batch_size * 2, 64)
+
+        return False, None
+
+    def trajectory_order(self, poses: np.ndarray, order: str) -> np.ndarray:
+        '''
+        return: the indexes of the poses in the checking order
+        '''
+        pose_num = len(poses)
+        if order == 'bisection':
+            # count from the end, the two ends are checked first, then the
+            # index with more trailing zero bits, e.g. 0, 16, 8, 4, 12, ... for 17 poses
+            from_end = np.arange(pose_num)
+            level = np.zeros(pose_num, dtype=np.int64)
+            for bit in range(1, max(pose_num, 2).bit_length()):
+                level += (from_end % (1 << bit)) == 0
+            level[-1] = level[0]
+            return (pose_num - 1 - from_end)[np.argsort(-level, kind='stable')]
+        elif order == 'clearance':
+            clearance = self.map.get_clearance(poses[:, 0], poses[:, 1])
+            return np.argsort(clearance, kind='stable')
+        else:
+            return np.arange(pose_num)
+
 
 class two_circle_checker(collision_checker):
     '''
@@ -96,46 +155,67 @@ class two_circle_checker(collision_checker):
         rear_circle = (node_x+1/4*(v.lw+v.lf-3*v.lr)*np.cos(theta),
                        node_y+1/4*(v.lw+v.lf-3*v.lr)*np.sin(theta))
 
-        # determine the AABB square of the two circles
-        if front_circle[0] >= rear_circle[0]:
-            right = front_circle[0] + Rd
-            left = rear_circle[0] - Rd
-        else:
-            right = rear_circle[0] + Rd
-            left = front_circle[0] - Rd
-
-        if front_circle[1] >= rear_circle[1]:
-            upper = front_circle[1] + Rd
-            down = rear_circle[1] - Rd
-        else:
-            upper = rear_circle[1] + Rd
-            down = front_circle[1] - Rd
-
-        # get obstacle position
-        obstacle_index = np.where(self.map.cost_map == 255)
-        obstacle_position_x = self.map.map_position[0][obstacle_index[0]]
-        obstacle_position_y = self.map.map_position[1][obstacle_index[1]]
-
-        # determine x
-        near_x_position = obstacle_position_x[np.where(
-            (obstacle_position_x > left) & (obstacle_position_x < right))]
-        near_y_position = obstacle_position_y[np.where(
-            (obstacle_position_x > left) & (obstacle_position_x < right))]
-        # determine y
-        near_obstacle_x = near_x_position[np.where(
-            (near_y_position > down) & (near_y_position < upper))]
-        near_obstacle_y = near_y_position[np.where(
-            (near_y_position > down) & (near_y_position < upper))]
-        # check these points
+        # find the obstacle points in the two circles
         collision = False
-        for x, y in zip(near_obstacle_x, near_obstacle_y):
-            if np.sqrt(pow(x-front_circle[0], 2) + pow(y-front_circle[1], 2)) <= Rd:
-                collision = True
-            elif np.sqrt(pow(x-rear_circle[0], 2) + pow(y-rear_circle[1], 2)) <= Rd:
+        for circle in (front_circle, rear_circle):
+            if self.map.is_in_map(circle[0], circle[1]):
+                # two lookups answer most queries, the exact search
+                # is only needed close to the circle boundary
+                clearance = self.map.get_clearance(circle[0], circle[1])
+                if clearance > Rd + self.map.distance_field_error:
+                    continue
+                if clearance < Rd - self.map.distance_field_error:
+                    collision = True
+                    break
+            near_obstacle_x, _ = self.map.query_radius(circle[0], circle[1], Rd)
+            if len(near_obstacle_x) > 0:
                 collision = True
+                break
 
         return collision
 
+    def check_many(self, poses: np.ndarray) -> np.ndarray:
+        '''
+        vectorized version of check, the obstacle points near all poses
+        are collected once and tested against every pair of circles
+        '''
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        if len(poses) == 0:
+            return np.zeros(0, dtype=bool)
+        v = self.vehicle
+
+        # compute circle diameter
+        Rd = 0.5 * np.sqrt(((v.lr+v.lw+v.lf)/2)**2 + (v.lb**2))
+        # compute circle center position, shape (2N, 2)
+        cos_theta = np.cos(poses[:, 2])
+        sin_theta = np.sin(poses[:, 2])
+        front_offset = 1/4*(3*v.lw+3*v.lf-v.lr)
+        rear_offset = 1/4*(v.lw+v.lf-3*v.lr)
+        centers = np.vstack((
+            np.stack((poses[:, 0] + front_offset * cos_theta,
+                      poses[:, 1] + front_offset * sin_theta), axis=1),
+            np.stack((poses[:, 0] + rear_offset * cos_theta,
+                      poses[:, 1] + rear_offset * sin_theta), axis=1)))
+
+        # the distance field decides the circles far from the circle boundary
+        in_map = self.map.is_in_map(centers[:, 0], centers[:, 1])
+        clearance = self.map.get_clearance(centers[:, 0], centers[:, 1])
+        in_circle = in_map & (clearance < Rd - self.map.distance_field_error)
+        undecided = ~in_map | (np.abs(clearance - Rd) <= self.map.distance_field_error)
+
+        if np.any(undecided):
+            undecided_centers = centers[undecided]
+            near_obstacle_x, near_obstacle_y = self.get_obstacle_points(
+                x_min=np.min(undecided_centers[:, 0]) - Rd, x_max=np.max(undecided_centers[:, 0]) + Rd,
+                y_min=np.min(undecided_centers[:, 1]) - Rd, y_max=np.max(undecided_centers[:, 1]) + Rd)
+
+            # distance from every circle center to every obstacle point
+            distance = np.hypot(near_obstacle_x[np.newaxis, :] - undecided_centers[:, 0:1],
+                                near_obstacle_y[np.newaxis, :] - undecided_centers[:, 1:2])
+            in_circle[undecided] = np.any(distance <= Rd, axis=1)
+
+        return in_circle[:len(poses)] | in_circle[len(poses):]
+
 
 class distance_checker(collision_checker):
     def __init__(self, map: Map, vehicle: Vehicle = None, config: dict = None) -> None:
@@ -239,6 +319,159 @@ class distance_checker(collision_checker):
 
         return collision
 
+    def check_many(self, poses: np.ndarray) -> np.ndarray:
+        '''
+        vectorized version of check, the obstacle points are moved into
+        the frame of every vehicle and tested against the expanded box.
+        As in check, a point should be more than 0.005 m inside both pairs
+        of edges, the exact corner and edge cases of check are not repeated.
+        Note: poses whose clearance is larger than the box are free, the
+              others are tested in groups of 16 with the obstacles of the group
+        '''
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        if len(poses) == 0:
+            return np.zeros(0, dtype=bool)
+        v = self.vehicle
+
+        # expanded vehicle box in the vehicle frame
+        rear = -v.lr - self.config['safe_fr_dis']
+        front = v.lw + v.lf + self.config['safe_fr_dis']
+        half_width = v.lb / 2 + self.config['safe_side_dis']
+        margin = 0.005
+
+        # the distance field decides the poses far from the obstacles
+        radius = np.hypot(max(abs(rear), front), half_width)
+        in_map = self.map.is_in_map(poses[:, 0], poses[:, 1])
+        clearance = self.map.get_clearance(poses[:, 0], poses[:, 1])
+        undecided = np.flatnonzero(~in_map | (clearance <= radius + self.map.distance_field_error))
+
+        collision = np.zeros(len(poses), dtype=bool)
+        # neighbouring poses share the obstacles of their AABB square
+        for start in range(0, len(undecided), 16):
+            index = undecided[start:start + 16]
+            group = poses[index]
+            near_obstacle_x, near_obstacle_y = self.get_obstacle_points(
+                x_min=np.min(group[:, 0]) - radius, x_max=np.max(group[:, 0]) + radius,
+                y_min=np.min(group[:, 1]) - radius, y_max=np.max(group[:, 1]) + radius)
+
+            # obstacle points in the vehicle frame, shape (n, M)
+            dx = near_obstacle_x[np.newaxis, :] - group[:, 0:1]
+            dy = near_obstacle_y[np.newaxis, :] - group[:, 1:2]
+            cos_theta = np.cos(group[:, 2:3])
+            sin_theta = np.sin(group[:, 2:3])
+            longitudinal = dx * cos_theta + dy * sin_theta
+            lateral = -dx * sin_theta + dy * cos_theta
+
+            in_box = (longitudinal > rear + margin) & (longitudinal < front - margin) & \
+                (np.abs(lateral) < half_width - margin)
+            collision[index] = np.any(in_box, axis=1)
+
+        return collision
+
+class cspace_checker(collision_checker):
+    '''
+    configuration space check: for each heading bin the occupancy grid is
+    dilated with the expanded vehicle footprint, so checking a pose is one
+    array gather. The footprint of a bin covers every heading of the bin and
+    every position in a grid cell, so the grid never misses a collision but
+    also reports some free poses, its hits are confirmed by the exact check.
+    config: cspace_heading_num is the number of heading bins,
+            cspace_lazy builds a bin only when it is first used,
+            cspace_bit_packed stores the bins in bits (8x less memory)
+    '''
+
+    def __init__(self, map: Map, vehicle: Vehicle = None, config: dict = None) -> None:
+        super().__init__(map, vehicle, config)
+        self.heading_num = config['cspace_heading_num']
+        self.bit_packed = config['cspace_bit_packed']
+        self.bin_size = 2 * np.pi / self.heading_num
+        # one occupancy grid for each heading bin
+        self.cspace = [None] * self.heading_num
+        # poses out of the grid are checked exactly
+        self.exact_checker = distance_checker(map, vehicle, config)
+        if not config['cspace_lazy']:
+            for k in range(self.heading_num):
+                self.build_heading_bin(k)
+
+    def footprint_kernel(self, heading_bin: int) -> np.ndarray:
+        '''
+        return: a bool kernel, kernel[rx + di][ry + dj] is true if the map
+                point (i + di, j + dj) may be covered by a vehicle in the
+                heading bin whose position is in the grid cell of (i, j)
+        '''
+        v = self.vehicle
+        dx = self.map._discrete_x
+        dy = self.map._discrete_y
+
+        # expanded vehicle box in the vehicle frame
+        rear = -v.lr - self.config['safe_fr_dis']
+        front = v.lw + v.lf + self.config['safe_fr_dis']
+        half_width = v.lb / 2 + self.config['safe_side_dis']
+
+        # a rotation of half the bin size moves a point at most r_max * bin_size / 2,
+        # the position is rounded to the nearest grid point
+        r_max = np.hypot(max(abs(rear), front), half_width)
+        pad = r_max * self.bin_size / 2 + np.hypot(dx, dy) / 2
+
+        rx = math.ceil((r_max + pad) / dx)
+        ry = math.ceil((r_max + pad) / dy)
+        offset_x, offset_y = np.meshgrid(np.arange(-rx, rx + 1) * dx,
+                                         np.arange(-ry, ry + 1) * dy,
+                                         indexing='ij')
+
+        theta = heading_bin * self.bin_size
+        longitudinal = offset_x * np.cos(theta) + offset_y * np.sin(theta)
+        lateral = -offset_x * np.sin(theta) + offset_y * np.cos(theta)
+
+        return (longitudinal >= rear - pad) & (longitudinal <= front + pad) & \
+            (np.abs(lateral) <= half_width + pad)
+
+    def build_heading_bin(self, heading_bin: int) -> None:
+        '''
+        dilate the occupancy grid with the footprint kernel of this bin
+        '''
+        occupancy = self.map.occupancy_grid().astype(np.float64)
+        kernel = self.footprint_kernel(heading_bin).astype(np.float64)
+        # correlation is the convolution with the flipped kernel
+        cspace = signal.fftconvolve(occupancy, kernel[::-1, ::-1], mode='same') > 0.5
+        if self.bit_packed:
+            cspace = np.packbits(cspace, axis=1)
+        self.cspace[heading_bin] = cspace
+
+    def check(self, node_x, node_y, theta) -> bool:
+        return bool(self.check_many(np.array([[node_x, node_y, theta]]))[0])
+
+    def check_many(self, poses: np.ndarray) -> np.ndarray:
+        poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+        collision = np.zeros(len(poses), dtype=bool)
+        x_size, y_size = self.map.grid_shape
+
+        # nearest grid point and heading bin
+        index_x = np.round((poses[:, 0] - self.map.boundary[0]) / self.map._discrete_x).astype(np.int64)
+        index_y = np.round((poses[:, 1] - self.map.boundary[2]) / self.map._discrete_y).astype(np.int64)
+        heading_bin = np.round(np.mod(poses[:, 2], 2 * np.pi) / self.bin_size).astype(np.int64) % self.heading_num
+        in_grid = (index_x >= 0) & (index_x < x_size) & (index_y >= 0) & (index_y < y_size)
+
+        for k in np.unique(heading_bin[in_grid]):
+            if self.cspace[k] is None:
+                self.build_heading_bin(k)
+            select = in_grid & (heading_bin == k)
+            i = index_x[select]
+            j = index_y[select]
+            if self.bit_packed:
+                collision[select] = (self.cspace[k][i, j >> 3] >> (7 - (j & 7))) & 1 == 1
+            else:
+                collision[select] = self.cspace[k][i, j]
+
+        # the grid is conservative, confirm its hits and the poses out of
+        # the grid with the exact check
+        candidate = collision | ~in_grid
+        if np.any(candidate):
+            collision[candidate] = self.exact_checker.check_many(poses[candidate])
+
+        return collision
+
+
 # def two_circle_check(node_x, node_y, theta, map: _map) -> bool:
 #     '''
 #     use two circle to present car body for collision check
@@ -8,8 +8,12 @@ import os
 def main(file, config):
     # create the park map
     park_map = costmap.Map(
-        file=file, discrete_size=config['map_discrete_size'])
+        file=file, discrete_size=config['map_discrete_size'],
+        fill_obstacle=config['map_fill_obstacle'],
+        bit_packed=config['map_bit_packed'])
     ploter.plot_obstacles(map=park_map)
+    if args.cost_map:
+        park_map.visual_cost_map()
     # save img
     fig_name = args.case_name + 'Map.png'
     fig_path = config['pic_path']
@@ -24,6 +28,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='hybridAstar')
     parser.add_argument("--config_name", type=str, default="config")
     parser.add_argument("--case_name", type=str, default="Case1")
+    parser.add_argument("--cost_map", action="store_true",
+                        help="draw the occupancy grid over the obstacles")
     args = parser.parse_args()
 
     # initial
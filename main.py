@@ -13,6 +13,7 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 from path_plan import path_planner
 from animation.animation import ploter, plt
 from animation.record_solution import DataRecorder
+from animation.visual_sink import RecordingSink
 from map import costmap
 from velocity_plan import velocity_planner
 from interpolation import path_interpolation
@@ -25,11 +26,33 @@ import os
 import argparse
 
 
-def main(file, config):
-    # create the park map
-    park_map = costmap.Map(
-        file=file, discrete_size=config['map_discrete_size'])
+def solve(file, config, case_name, draw=True, result=None):
+    '''
+    solve one benchmark case
+    param: case_name names the saved files, draw saves the figures and the gif,
+           result is filled while solving, so it keeps the finished stages
+           when a later stage raises
+    return: dict of the solving statistics, see benchmark.py
+    '''
+    if result is None:
+        result = {}
+    result.update({'case': case_name, 'success': False, 'path_found': False,
+                   'map_time': None, 'plan_time': None, 'optimize_time': None,
+                   'expanded_nodes': None, 'generated_nodes': None,
+                   'rs_cache_hit': None, 'rs_cache_miss': None,
+                   'path_points': None, 'optimal_tf': None, 'collision': None})
 
+    # create the park map
+    start_time = time.time()
+    if config['map_cache']:
+        park_map = costmap.Map.load_or_build(file=file, config=config)
+    else:
+        park_map = costmap.Map(
+            file=file, discrete_size=config['map_discrete_size'],
+            fill_obstacle=config['map_fill_obstacle'],
+            bit_packed=config['map_bit_packed'])
+
+    result['map_time'] = time.time() - start_time
     print("Created: park map")
 
     # create vehicle
@@ -74,19 +97,37 @@ def main(file, config):
     optimal_tf = 0
     t = 0
     optimal_time_info = []
+    start_time = time.time()
     original_path, path_info, split_path = planner.path_planning()
+    result['plan_time'] = time.time() - start_time
+    result['expanded_nodes'] = planner.planner.expanded_num
+    result['generated_nodes'] = len(planner.planner.node_store)
+    rs_cache_info = planner.planner.rs_cache_info()
+    result['rs_cache_hit'] = rs_cache_info['hit']
+    result['rs_cache_miss'] = rs_cache_info['miss']
+    # save the exploration trace, trace_render draws it afterwards
+    if isinstance(planner.sink, RecordingSink):
+        if not os.path.exists(config['pic_path']):
+            os.makedirs(config['pic_path'])
+        trace_file = os.path.join(config['pic_path'], case_name + '_trace.npz')
+        planner.sink.save(trace_file)
+        print("Saved: exploration trace", trace_file)
     # added by Mike
     if original_path == None:
         print("Failed to find a path")
-        fig_name = args.case_name + '.png'
-        fig_path = config['pic_path']
-        if not os.path.exists(fig_path):
-            os.makedirs(fig_path)
-        save_fig = os.path.join(fig_path, fig_name)
-        plt.savefig(save_fig, dpi=600)
-        plt.close()
-        return
-
+        if draw:
+            fig_name = case_name + '.png'
+            fig_path = config['pic_path']
+            if not os.path.exists(fig_path):
+                os.makedirs(fig_path)
+            save_fig = os.path.join(fig_path, fig_name)
+            plt.savefig(save_fig, dpi=600)
+            plt.close()
+        return result
+    result['path_found'] = True
+    result['path_points'] = len(original_path)
+
+    start_time = time.time()
     for path_i in split_path:
         # optimize path
         opti_path, forward = path_optimizer.get_result(path_i)
@@ -117,12 +158,29 @@ def main(file, config):
         final_insert_path.extend(insert_path)
         final_ocp_path.extend(ocp_traj)
 
+    result['optimize_time'] = time.time() - start_time
+    result['optimal_tf'] = optimal_tf
+
+    # validate the final trajectory
+    collision, collision_p = planner.collision_checker.check_trajectory(
+        [p[:3] for p in final_ocp_path])
+    result['collision'] = bool(collision)
+    result['success'] = not result['collision']
+    if collision:
+        print("Warning: the optimized trajectory collides at", collision_p)
+        if draw and config['draw_collision']:
+            ploter.plot_collision_p(
+                collision_p[0], collision_p[1], collision_p[2], park_map)
+
     # save traj into a csv file
     DataRecorder.record(save_path=config['save_path'],
-                        save_name=case_name, trajectory=final_ocp_path)
+                        save_name=case_name + '.csv', trajectory=final_ocp_path)
 
-    # animation
     print('trajectory_time:', optimal_tf)
+    if not draw:
+        return result
+
+    # animation
     ploter.plot_obstacles(map=park_map)
     park_map.visual_cost_map()
     ploter.plot_final_path(path=original_path, label='Hybrid A*',
@@ -134,18 +192,24 @@ def main(file, config):
     ploter.plot_final_path(path=final_ocp_path, label='Optimized Traj',
                            color='gray', show_car=True)
     plt.legend()
-    fig_name = args.case_name + '.png'
+    fig_name = case_name + '.png'
     fig_path = config['pic_path']
     if not os.path.exists(fig_path):
         os.makedirs(fig_path)
     save_fig = os.path.join(fig_path, fig_name)
     plt.savefig(save_fig, dpi=600)
     plt.close()
-    gif_name = args.case_name + '.gif'
+    gif_name = case_name + '.gif'
     save_gif_name = os.path.join(fig_path, gif_name)
     ploter.save_gif(path=final_ocp_path, color='gray', map=park_map,
-                    show_car=True, save_gif_name=save_gif_name)
+                    show_car=True, save_gif_name=save_gif_name,
+                    workers=config['gif_workers'])
     print('solved')
+    return result
+
+
+def main(file, config):
+    solve(file=file, config=config, case_name=args.case_name)
 
 
 if __name__ == '__main__':
@@ -46,8 +46,10 @@ import string
 import numpy as np
 import math
 import csv
-import shapely.geometry
+import hashlib
+import os
 import matplotlib.pyplot as plt
+from scipy import ndimage
 class Vehicle:
     def __init__(self):
         self.lw = 2.8  # wheelbase
@@ -159,10 +161,14 @@ class Case:
 class Map:
     def __init__(self,
                  discrete_size: np.float64 = 0.1,
-                 file: string = None) -> None:
+                 file: string = None,
+                 fill_obstacle: bool = False,
+                 bit_packed: bool = False) -> None:
         self.discrete_size = discrete_size
         self.grid_index = None  # index of each grid
-        self.cost_map = np.array([], dtype=np.float64)  # cost value
+        self.cost_map = np.array([], dtype=np.uint8)  # cost value, 255 for obstacles
+        self.occupancy_bits = None  # cost_map packed in bits, see pack_occupancy
+        self.grid_shape = (0, 0)
         self.map_position = np.array([], dtype=np.float64)  # (x,y) value
         self.case = Case.read(file)
         # math.floor: return the largest integer not greater than x
@@ -170,10 +176,128 @@ class Map:
                                   math.floor(self.case.xmax),
                                   math.floor(self.case.ymin),
                                   math.floor(self.case.ymax)], dtype=np.float64)
-        # self.detect_obstacle()
         self._discrete_x = 0
         self._discrete_y = 0
-        self.detect_obstacle_edge()
+        if fill_obstacle:
+            self.detect_obstacle()
+        else:
+            self.detect_obstacle_edge()
+        # bucket the obstacle points for the collision queries
+        self.build_obstacle_index()
+        # distance from each grid point to the nearest obstacle
+        self.build_distance_field()
+        if bit_packed:
+            self.pack_occupancy()
+        # distance from the goal to each grid, filled by the planner or
+        # loaded from the map bundle
+        self.heuristic_field = None
+        # rgba image of the occupancy grid, see cost_map_image
+        self.cost_map_rgba = None
+
+    # version of the map bundle layout, change it when the stored data changes
+    bundle_version = 3
+    bundle_arrays = ('cost_map', 'boundary', 'map_position_x', 'map_position_y',
+                     'obstacle_x', 'obstacle_y', 'bucket_start',
+                     'distance_field', 'heuristic_field', 'meta')
+
+    @classmethod
+    def load_or_build(cls, file: string, config: dict):
+        '''
+        load the compiled map bundle of the case, the bundle is built and
+        saved in config['map_cache_path'] if it does not exist
+        param: file is the case file, the bundle is keyed by the content of
+               the file, map_discrete_size, map_fill_obstacle and the safe distances
+        return: the park map, the arrays are memory mapped (read only),
+                the occupancy grid is packed in bits if config['map_bit_packed']
+        '''
+        with open(file, 'rb') as f:
+            key = hashlib.sha1(f.read())
+        key.update(repr((cls.bundle_version,
+                         float(config['map_discrete_size']),
+                         bool(config['map_fill_obstacle']),
+                         float(config['safe_side_dis']),
+                         float(config['safe_fr_dis']))).encode())
+        case_name = os.path.splitext(os.path.basename(file))[0]
+        bundle_path = os.path.join(config['map_cache_path'],
+                                   case_name + '_' + key.hexdigest()[:16])
+
+        if not os.path.isdir(bundle_path):
+            park_map = cls(discrete_size=config['map_discrete_size'], file=file,
+                           fill_obstacle=config['map_fill_obstacle'])
+            # import here, compute_h depends on this module
+            from path_plan.compute_h import Dijkstra
+            park_map.heuristic_field = Dijkstra(park_map).compute_field()
+            park_map.save_bundle(bundle_path)
+
+        park_map = cls.load_bundle(bundle_path, file)
+        if config['map_bit_packed']:
+            park_map.pack_occupancy()
+        return park_map
+
+    def save_bundle(self, bundle_path: string):
+        '''
+        save the map arrays as .npy files in the bundle folder, the folder is
+        written under a temporary name and renamed when it is complete
+        '''
+        arrays = {'cost_map': np.where(self.occupancy_grid(), 255, 0).astype(np.uint8),
+                  'boundary': self.boundary,
+                  'map_position_x': self.map_position[0],
+                  'map_position_y': self.map_position[1],
+                  'obstacle_x': self.obstacle_x,
+                  'obstacle_y': self.obstacle_y,
+                  'bucket_start': self._bucket_start,
+                  'distance_field': self.distance_field,
+                  'heuristic_field': self.heuristic_field,
+                  'meta': np.array([self.discrete_size,
+                                    self._discrete_x,
+                                    self._discrete_y,
+                                    self._bucket_size,
+                                    self._bucket_num_x,
+                                    self._bucket_num_y,
+                                    self.distance_field_error], dtype=np.float64)}
+        temp_path = bundle_path + '.tmp%d' % os.getpid()
+        os.makedirs(temp_path)
+        for name in self.bundle_arrays:
+            np.save(os.path.join(temp_path, name + '.npy'), arrays[name])
+        try:
+            os.rename(temp_path, bundle_path)
+        except OSError:
+            # another process saved the same bundle first
+            for name in self.bundle_arrays:
+                os.remove(os.path.join(temp_path, name + '.npy'))
+            os.rmdir(temp_path)
+
+    @classmethod
+    def load_bundle(cls, bundle_path: string, file: string):
+        '''
+        create the park map from a bundle without any preprocessing
+        '''
+        arrays = {name: np.load(os.path.join(bundle_path, name + '.npy'), mmap_mode='r')
+                  for name in cls.bundle_arrays}
+        meta = arrays['meta']
+
+        park_map = cls.__new__(cls)
+        park_map.discrete_size = float(meta[0])
+        park_map.grid_index = None
+        park_map.case = Case.read(file)
+        park_map.cost_map = arrays['cost_map']
+        park_map.occupancy_bits = None
+        park_map.grid_shape = park_map.cost_map.shape
+        park_map.boundary = np.array(arrays['boundary'])
+        park_map.map_position = (arrays['map_position_x'], arrays['map_position_y'])
+        park_map._discrete_x = float(meta[1])
+        park_map._discrete_y = float(meta[2])
+        park_map.obstacle_x = arrays['obstacle_x']
+        park_map.obstacle_y = arrays['obstacle_y']
+        park_map._bucket_start = arrays['bucket_start']
+        park_map._bucket_size = float(meta[3])
+        park_map._bucket_num_x = int(meta[4])
+        park_map._bucket_num_y = int(meta[5])
+        park_map.distance_field = arrays['distance_field']
+        park_map.distance_field_error = float(meta[6])
+        park_map.heuristic_field = arrays['heuristic_field']
+        park_map.cost_map_rgba = None
+        return park_map
 
     def discrete_map(self):
         '''
@@ -183,7 +307,8 @@ class Map:
             (self.boundary[1] - self.boundary[0]) / self.discrete_size)
         y_size = int(
             (self.boundary[3] - self.boundary[2]) / self.discrete_size)
-        self.cost_map = np.zeros((x_size, y_size), dtype=np.float64)
+        self.cost_map = np.zeros((x_size, y_size), dtype=np.uint8)
+        self.grid_shape = self.cost_map.shape
         # create (x,y) position
         dx_position = np.linspace(self.boundary[0], self.boundary[1], x_size)
         dy_position = np.linspace(self.boundary[2], self.boundary[3], y_size)
@@ -200,7 +325,9 @@ class Map:
         # discrete map
         self.discrete_map()
 
-        # get obstacles edge
+        # sample points on the edges of all obstacles
+        edge_points_x = []
+        edge_points_y = []
         for i in range(0, self.case.obs_num):
             old_obstacle = self.case.obs[i]
             # delete redundant points
@@ -247,73 +374,270 @@ class Map:
                 _points_position = np.dot(
                     rotation_matrix.transpose(), points_position)
 
-                for k in range(points_num):
-                    original_points_position = [_points_position[0][k]+obstacle_p1[0],
-                                                _points_position[1][k]+obstacle_p1[1]]
+                edge_points_x.append(_points_position[0] + obstacle_p1[0])
+                edge_points_y.append(_points_position[1] + obstacle_p1[1])
 
-                    points_x_index = np.where((self.map_position[0] < original_points_position[0]) &
-                                              (self.map_position[0] > (original_points_position[0]-self._discrete_x)))
+        if len(edge_points_x) == 0:
+            return
+        edge_points_x = np.concatenate(edge_points_x)
+        edge_points_y = np.concatenate(edge_points_y)
 
-                    points_y_index = np.where((self.map_position[1] < original_points_position[1]) &
-                                              (self.map_position[1] > (original_points_position[1]-self._discrete_y)))
+        # a point belongs to the grid whose map point is in (point - discrete, point)
+        points_x_index, valid_x = self.locate_grid(edge_points_x, self.map_position[0],
+                                                   self.boundary[0], self._discrete_x)
+        points_y_index, valid_y = self.locate_grid(edge_points_y, self.map_position[1],
+                                                   self.boundary[2], self._discrete_y)
+        valid = valid_x & valid_y
+        self.cost_map[points_x_index[valid], points_y_index[valid]] = 255
 
-                    if any(points_x_index) and any(points_y_index):
-                        self.cost_map[int(points_x_index[0])
-                                      ][int(points_y_index[0])] = 255
+    @staticmethod
+    def locate_grid(points, map_position, start, discrete):
+        '''
+        param: the position of points along one axis
+        return: the index of the largest map position smaller than each point
+                and whether this map position is larger than point - discrete
+        '''
+        position_num = len(map_position)
+        index = np.floor((points - start) / discrete).astype(np.int64)
+        index = np.clip(index, 0, position_num - 1)
+        # correct the floating error of the arithmetic index
+        next_index = np.minimum(index + 1, position_num - 1)
+        index = np.where(map_position[next_index] < points, next_index, index)
+        index = np.where(map_position[index] >= points, index - 1, index)
+
+        valid = index >= 0
+        index = np.maximum(index, 0)
+        valid &= (map_position[index] < points) & \
+            (map_position[index] > points - discrete)
+        return index, valid
 
     def detect_obstacle(self):
-        # discrete map
-        self.discrete_map()
+        '''
+        fill the obstacles: the edges are rasterized first so that thin
+        obstacles are kept, then the interior of each polygon is filled
+        row by row with a scanline (even-odd rule)
+        '''
+        self.detect_obstacle_edge()
+        points_x = self.map_position[0]
+        points_y = self.map_position[1]
 
         for i in range(0, self.case.obs_num):
             obstacle = self.case.obs[i]
-            # get the rectangle of the obstancle
+            # get the rows of map points in the rectangle of the obstacle
             obstacle_xmin, obstacle_xmax = np.min(
                 obstacle[:, 0]), np.max(obstacle[:, 0])
-            obstacle_ymin, obstacle_ymax = np.min(
-                obstacle[:, 1]), np.max(obstacle[:, 1])
-            # find map points in the rectangle
-            near_obs_x_index = np.where((self.map_position[0] >= obstacle_xmin) & (
-                self.map_position[0] <= obstacle_xmax))
-            near_obs_y_index = np.where((self.map_position[1] >= obstacle_ymin) & (
-                self.map_position[1] <= obstacle_ymax))
-            # determine the near points is in the obstacle or not
-            # create polygon
-            poly_shape = shapely.geometry.Polygon(obstacle)
-            # generate potints
-            points_x = self.map_position[0]
-            points_y = self.map_position[1]
-            for i in near_obs_x_index[0]:
-                for j in near_obs_y_index[0]:
-                    # print(points_x[i], points_y[j])
-                    point = shapely.geometry.Point(points_x[i], points_y[j])
-                    if poly_shape.intersects(point):
-                        # point in the obstacl, set the cost = 255
-                        if self.cost_map[i][j] != 255:
-                            self.cost_map[i][j] = 255
-
-        # print(self.cost_map.shape)
-
-    def visual_cost_map(self):
-        plt.figure(1)
-        for i in range(len(self.map_position[0])):
-            for j in range(len(self.map_position[1])):
-                if self.cost_map[i][j] == 255:
-                    plt.plot(
-                        self.map_position[0][i], self.map_position[1][j], 'x', color='k')
+            row_start = np.searchsorted(points_x, obstacle_xmin, side='left')
+            row_end = np.searchsorted(points_x, obstacle_xmax, side='right')
+            if row_start >= row_end:
+                continue
+            rows = points_x[row_start:row_end].reshape(-1, 1)
+
+            # edges of the polygon
+            p1 = obstacle
+            p2 = np.roll(obstacle, -1, axis=0)
+            # the scanline x = row crosses an edge if the row is in [x1, x2)
+            crossed = (p1[:, 0] <= rows) != (p2[:, 0] <= rows)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = (rows - p1[:, 0]) / (p2[:, 0] - p1[:, 0])
+                crossing_y = np.where(crossed, p1[:, 1] + ratio * (p2[:, 1] - p1[:, 1]),
+                                      np.inf)
+            crossing_y.sort(axis=1)
+
+            # the points between the crossing 2k and 2k+1 are in the obstacle
+            for j in range(0, crossing_y.shape[1] - 1, 2):
+                enter_y = crossing_y[:, j]
+                leave_y = crossing_y[:, j+1]
+                inside = np.isfinite(leave_y)
+                col_start = np.searchsorted(points_y, enter_y[inside], side='left')
+                col_end = np.searchsorted(points_y, leave_y[inside], side='right')
+                for row, start, end in zip(np.nonzero(inside)[0] + row_start,
+                                           col_start, col_end):
+                    self.cost_map[row, start:end] = 255
+
+    def build_obstacle_index(self, bucket_size: np.float64 = 1.0):
+        '''
+        put the obstacle points into a uniform bucket grid, the points are
+        sorted by bucket id so the points of bucket k are
+        obstacle_x[bucket_start[k]:bucket_start[k+1]]
+        param: bucket_size is the side length of a bucket (m)
+        '''
+        obstacle_index = np.nonzero(self.occupancy_grid())
+        obstacle_x = self.map_position[0][obstacle_index[0]]
+        obstacle_y = self.map_position[1][obstacle_index[1]]
+
+        self._bucket_size = bucket_size
+        self._bucket_num_x = math.floor(
+            (self.boundary[1] - self.boundary[0]) / bucket_size) + 1
+        self._bucket_num_y = math.floor(
+            (self.boundary[3] - self.boundary[2]) / bucket_size) + 1
+        bucket_x = np.clip(np.floor((obstacle_x - self.boundary[0]) / bucket_size).astype(np.int64),
+                           0, self._bucket_num_x - 1)
+        bucket_y = np.clip(np.floor((obstacle_y - self.boundary[2]) / bucket_size).astype(np.int64),
+                           0, self._bucket_num_y - 1)
+        bucket_id = bucket_x * self._bucket_num_y + bucket_y
+
+        order = np.argsort(bucket_id, kind='stable')
+        self.obstacle_x = obstacle_x[order]
+        self.obstacle_y = obstacle_y[order]
+        self._bucket_start = np.searchsorted(bucket_id[order],
+                                             np.arange(self._bucket_num_x * self._bucket_num_y + 1))
+
+    def query_aabb(self, x_min, x_max, y_min, y_max):
+        '''
+        return: x and y of the obstacle points in the AABB square (boundary included)
+        '''
+        def bucket_range(v_min, v_max, v_boundary, bucket_num):
+            start = max(math.floor((v_min - v_boundary) / self._bucket_size), 0)
+            end = min(math.floor((v_max - v_boundary) / self._bucket_size), bucket_num - 1)
+            return start, end
+
+        bx_start, bx_end = bucket_range(x_min, x_max, self.boundary[0], self._bucket_num_x)
+        by_start, by_end = bucket_range(y_min, y_max, self.boundary[2], self._bucket_num_y)
+        if bx_start > bx_end or by_start > by_end:
+            return np.zeros(0), np.zeros(0)
+
+        # buckets with the same x are stored next to each other
+        slices = []
+        for bx in range(bx_start, bx_end + 1):
+            start = self._bucket_start[bx * self._bucket_num_y + by_start]
+            end = self._bucket_start[bx * self._bucket_num_y + by_end + 1]
+            if end > start:
+                slices.append(slice(start, end))
+        if len(slices) == 0:
+            return np.zeros(0), np.zeros(0)
+        if len(slices) == 1:
+            near_x = self.obstacle_x[slices[0]]
+            near_y = self.obstacle_y[slices[0]]
+        else:
+            near_x = np.concatenate([self.obstacle_x[s] for s in slices])
+            near_y = np.concatenate([self.obstacle_y[s] for s in slices])
+
+        in_square = (near_x >= x_min) & (near_x <= x_max) & \
+            (near_y >= y_min) & (near_y <= y_max)
+        return near_x[in_square], near_y[in_square]
+
+    def query_radius(self, x, y, radius):
+        '''
+        return: x and y of the obstacle points whose distance to (x, y) <= radius
+        '''
+        near_x, near_y = self.query_aabb(x - radius, x + radius,
+                                         y - radius, y + radius)
+        in_circle = np.hypot(near_x - x, near_y - y) <= radius
+        return near_x[in_circle], near_y[in_circle]
+
+    def build_distance_field(self):
+        '''
+        euclidean distance transform of the grid, distance_field[i][j] is
+        the distance (m) from map point (i, j) to the nearest obstacle point,
+        it is stored in float32 (far below the grid resolution)
+        '''
+        free = ~self.occupancy_grid()
+        if np.all(free):
+            self.distance_field = np.full(self.grid_shape, np.inf, dtype=np.float32)
+        else:
+            self.distance_field = ndimage.distance_transform_edt(
+                free, sampling=(self._discrete_x, self._discrete_y)).astype(np.float32)
+        # the bilinear lookup of a distance function is off by at most
+        # the diagonal of a grid cell
+        self.distance_field_error = np.hypot(self._discrete_x, self._discrete_y)
+
+    def get_clearance(self, x, y):
+        '''
+        bilinear lookup of the distance field at arbitrary (x, y)
+        param: x and y can be float or np.array
+        return: the distance to the nearest obstacle point, positions out of
+                the map are clamped to the map boundary
+        '''
+        x_size, y_size = self.distance_field.shape
+        index_x = np.clip((np.asarray(x) - self.boundary[0]) / self._discrete_x,
+                          0, x_size - 1)
+        index_y = np.clip((np.asarray(y) - self.boundary[2]) / self._discrete_y,
+                          0, y_size - 1)
+        x_0 = np.minimum(np.floor(index_x).astype(np.int64), x_size - 2)
+        y_0 = np.minimum(np.floor(index_y).astype(np.int64), y_size - 2)
+        t_x = index_x - x_0
+        t_y = index_y - y_0
+
+        field = self.distance_field
+        clearance = (1 - t_x) * (1 - t_y) * field[x_0, y_0] + \
+            t_x * (1 - t_y) * field[x_0 + 1, y_0] + \
+            (1 - t_x) * t_y * field[x_0, y_0 + 1] + \
+            t_x * t_y * field[x_0 + 1, y_0 + 1]
+        return clearance
+
+    def is_in_map(self, x, y):
+        '''
+        return: whether (x, y) is inside the map boundary, arrays are supported
+        '''
+        return (np.asarray(x) >= self.boundary[0]) & (np.asarray(x) <= self.boundary[1]) & \
+            (np.asarray(y) >= self.boundary[2]) & (np.asarray(y) <= self.boundary[3])
+
+    def pack_occupancy(self):
+        '''
+        keep the occupancy grid in bits (8 grids of a row per byte) and
+        release cost_map, use is_occupied or occupancy_grid to read it
+        '''
+        self.occupancy_bits = np.packbits(self.cost_map == 255, axis=1)
+        self.cost_map = None
+
+    def occupancy_grid(self):
+        '''
+        return: bool array in the shape of the grid, True for obstacles
+        '''
+        if self.occupancy_bits is not None:
+            return np.unpackbits(self.occupancy_bits, axis=1,
+                                 count=self.grid_shape[1]).astype(bool)
+        return self.cost_map == 255
+
+    def is_occupied(self, x_index, y_index):
+        '''
+        param: the index of the grid, int or np.array
+        return: whether the grid is an obstacle
+        '''
+        if self.occupancy_bits is not None:
+            y_index = np.asarray(y_index)
+            bits = self.occupancy_bits[x_index, y_index >> 3]
+            return ((bits >> (7 - (y_index & 7))) & 1).astype(bool)
+        return self.cost_map[x_index, y_index] == 255
+
+    def cost_map_image(self):
+        '''
+        return: rgba image of the occupancy grid, shape (y_num, x_num, 4),
+                obstacles are black and free grids are transparent,
+                it is rendered once and reused by every figure
+        '''
+        if self.cost_map_rgba is None:
+            image = np.zeros(self.grid_shape[::-1] + (4,), dtype=np.uint8)
+            image[self.occupancy_grid().T, 3] = 255
+            self.cost_map_rgba = image
+        return self.cost_map_rgba
+
+    def cost_map_extent(self):
+        '''
+        return: (left, right, bottom, top) of the grids, each grid is
+                centered at its position
+        '''
+        return (self.map_position[0][0] - 0.5 * self._discrete_x,
+                self.map_position[0][-1] + 0.5 * self._discrete_x,
+                self.map_position[1][0] - 0.5 * self._discrete_y,
+                self.map_position[1][-1] + 0.5 * self._discrete_y)
+
+    def visual_cost_map(self, fig_id=1):
+        plt.figure(fig_id)
+        plt.imshow(self.cost_map_image(), extent=self.cost_map_extent(),
+                   origin='lower', interpolation='nearest')
         plt.xlim(self.case.xmin, self.case.xmax)
         plt.ylim(self.case.ymin, self.case.ymax)
         plt.draw()
-        # plt.show()
-        # print('ok')
 
     def visual_near_vehicle_map(self, xmin, xmax, ymin, ymax):
         plt.figure(1)
-        for i in range(len(self.map_position[0])):
-            for j in range(len(self.map_position[1])):
-                if self.map_position[0][i] >= xmin and self.map_position[0][i] <= xmax and self.map_position[1][j] >= ymin and self.map_position[1][j] <= ymax:
-                    plt.plot(
-                        self.map_position[0][i], self.map_position[1][j], 'x', color='k')
+        x = self.map_position[0]
+        y = self.map_position[1]
+        x = x[(x >= xmin) & (x <= xmax)]
+        y = y[(y >= ymin) & (y <= ymax)]
+        grid_x, grid_y = np.meshgrid(x, y, indexing='ij')
+        plt.scatter(grid_x.ravel(), grid_y.ravel(), marker='x', color='k')
         plt.xlim(self.case.xmin, self.case.xmax)
         plt.ylim(self.case.ymin, self.case.ymax)
 
@@ -74,22 +74,9 @@ class ocp_optimization:
             y_max = max(vehicle_boundary[:, 1]) + self.expand_dis
             y_min = min(vehicle_boundary[:, 1]) - self.expand_dis
 
-            # get obstacle position
-            obstacle_index = np.where(map.cost_map == 255)
-            obstacle_position_x = map.map_position[0][obstacle_index[0]]
-            obstacle_position_y = map.map_position[1][obstacle_index[1]]
-
             # find those obstacles point in the AABB square
-            near_x_position = obstacle_position_x[np.where(
-                (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-            near_y_position = obstacle_position_y[np.where(
-                (obstacle_position_x >= x_min) & (obstacle_position_x <= x_max))]
-
-            # determine y
-            near_obstacle_x = near_x_position[np.where(
-                (near_y_position >= y_min) & (near_y_position <= y_max))]
-            near_obstacle_y = near_y_position[np.where(
-                (near_y_position >= y_min) & (near_y_position <= y_max))]
+            near_obstacle_x, near_obstacle_y = map.query_aabb(
+                x_min=x_min, x_max=x_max, y_min=y_min, y_max=y_max)
 
             near_obstacle_range = [near_obstacle_x, near_obstacle_y]
 
@@ -10,264 +10,162 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 '''
 
 
-from matplotlib.pyplot import grid
 import numpy as np
-import queue
+import heapq
 import math
+from scipy import sparse
+from scipy.sparse import csgraph
 from map.costmap import Map
 
 
-class Grid:
-    def __init__(self,
-                 grid_id: int,
-                 grid_x: np.float64,
-                 grid_y: np.float64,
-                 distance: int,
-                 father_id: int) -> None:
-        self.grid_id = grid_id
-        self.grid_x = grid_x
-        self.grid_y = grid_y
-        self.distance = distance
-        self.father_id = father_id
-
-    def __lt__(self, other):
-        if self.distance == other.distance:
-            result = self.grid_id < other.grid_id
-        else:
-            result = self.distance < other.distance
-        return result
-
-
 class Dijkstra:
     def __init__(self, map: Map) -> None:
         self.map = map
         self.final_point = (map.case.xf, map.case.yf, map.case.thetaf)
-        self.open_list = queue.PriorityQueue()
-        self.closedlist = []  # store Class Grid
-        self.openlist_index = []
-        self.find_terminate = False
-
-    def initial_map(self, node_x, node_y):
+        self.x_num, self.y_num = map.grid_shape
+        # the search is kept between the calls of compute_path,
+        # a grid id is x_index * y_num + y_index
+        self.open_list = []  # heap of (distance, grid id)
+        self.distance = np.full(self.x_num * self.y_num, np.inf)  # best known distance
+        self.settled = np.zeros(self.x_num * self.y_num, dtype=bool)  # closed grids
+        self.initial_map()
+        # heuristic value of every grid, see compute_field
+        self.field = None
+
+    def initial_map(self):
         '''
-        input: the node position
+        we set final node as the initial grid
+        and our goal is to find the distance(priority)
+        between the current node(terminate node) and the final node.
         '''
-        # locate initial point grid
-        # we set final node as the initial grid
-        # and our goal is to find the distance(priority)
-        # between the current node(terminate node) and the final node.
-        # print(f"final point: ({self.final_point[0]}, {self.final_point[1]})")
-        # print(f"initial_grid_x = {self.final_point[0]} - {(self.final_point[0] - self.map.boundary[0]) % self.map._discrete_x}")
-        initial_grid_x = np.float64(self.final_point[0])
-        initial_grid_y = np.float64(self.final_point[1])
-        # initial_grid_x = self.final_point[0] - (self.final_point[0] - self.map.boundary[0]) % self.map._discrete_x
-        # initial_grid_y = self.final_point[1] - (self.final_point[1] - self.map.boundary[2]) % self.map._discrete_y
-        terminate_grid_x = np.float64(node_x)
-        terminate_grid_y = np.float64(node_y)
-
-        # Mike added
-        # print(f"initial_grid_x: {initial_grid_x} _y: {initial_grid_y} terminate_grid_x: {terminate_grid_x} _y: {terminate_grid_y}")
-
-        # initialize openlist and closedlist
-        initial_grid_id = self.map.convert_position_to_index(initial_grid_x,
-                                                             initial_grid_y)
-        initial_grid = Grid(initial_grid_id, initial_grid_x, initial_grid_y,
-                            distance=0, father_id=0)
-
-        self.closedlist.append(initial_grid)
-        self.terminate_grid_id = self.map.convert_position_to_index(
-            terminate_grid_x, terminate_grid_y)
-
-        return initial_grid
+        initial_x, initial_y = self.locate_grid(self.final_point[0], self.final_point[1])
+        initial_grid_id = initial_x * self.y_num + initial_y
+        self.distance[initial_grid_id] = 0
+        heapq.heappush(self.open_list, (0, initial_grid_id))
 
     def update_closedlist(self):
-        # find the minimum distance in the openlist and
-        # add it into the closedlist
-        # print(self.open_list.empty())
-        next_grid = self.open_list.get()
-        if next_grid.grid_id == self.terminate_grid_id:
-            self.find_terminate = True
-            print("found terminate")
-        
-        self.closedlist.append(next_grid)
+        '''
+        settle the grid with the minimum distance in the openlist
+        return: the grid id, None if the openlist is empty
+        '''
+        while self.open_list:
+            distance, grid_id = heapq.heappop(self.open_list)
+            # skip the stale entries of grids updated with a shorter distance
+            if self.settled[grid_id] or distance > self.distance[grid_id]:
+                continue
+            self.settled[grid_id] = True
+            return grid_id
 
-        return next_grid
+        return None
 
-    def update_openlist(self, current_grid: Grid = None):
+    def update_openlist(self, grid_id: int):
         # compute the near grids info
-        for i in range(8):
-            # left upper grid
-            if i == 0:
-                # print(f"current grid x: {current_grid.grid_x}  current grid y: {current_grid.grid_y}")
-                grid_x = current_grid.grid_x - self.map._discrete_x
-                grid_y = current_grid.grid_y + self.map._discrete_y
-                # check is obstacle
-                if self.is_obstacle(grid_x, grid_y):
+        x_index, y_index = divmod(grid_id, self.y_num)
+        for delta_x in (-1, 0, 1):
+            for delta_y in (-1, 0, 1):
+                if delta_x == 0 and delta_y == 0:
                     continue
+                next_x = x_index + delta_x
+                next_y = y_index + delta_y
                 # check the grid whether in the map
-                if grid_x >= self.map.boundary[0] and \
-                   grid_y <= self.map.boundary[3]:
-                    priority = current_grid.distance + 14
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
-
-            # upper grid
-            if i == 1:
-                grid_x = current_grid.grid_x
-                grid_y = current_grid.grid_y + self.map._discrete_y
-                # check is obstacle
-                if self.is_obstacle(grid_x, grid_y):
+                if next_x < 0 or next_x >= self.x_num or \
+                   next_y < 0 or next_y >= self.y_num:
                     continue
-                # check the grid whether in the map
-                if grid_y <= self.map.boundary[3]:
-                    priority = current_grid.distance + 10
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
-
-            # right upper grid
-            if i == 2:
-                grid_x = current_grid.grid_x + self.map._discrete_x
-                grid_y = current_grid.grid_y + self.map._discrete_y
-                if self.is_obstacle(grid_x, grid_y):
+                # check collision, the occupancy is read in place (it may be
+                # packed in bits)
+                if self.map.is_occupied(next_x, next_y):
                     continue
-                # check the grid whether in the map
-                if grid_x <= self.map.boundary[1] and \
-                   grid_y <= self.map.boundary[3]:
-                    priority = current_grid.distance + 14
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
-
-            # left grid
-            if i == 3:
-                grid_x = current_grid.grid_x - self.map._discrete_x
-                grid_y = current_grid.grid_y
-                if self.is_obstacle(grid_x, grid_y):
-                    continue
-                # check the grid whether in the map
-                if grid_x >= self.map.boundary[0]:
-                    priority = current_grid.distance + 10
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
-
-            # right grid
-            if i == 4:
-                grid_x = current_grid.grid_x + self.map._discrete_x
-                grid_y = current_grid.grid_y
-                if self.is_obstacle(grid_x, grid_y):
-                    continue
-                # check the grid whether in the map
-                if grid_x <= self.map.boundary[1]:
-                    priority = current_grid.distance + 10
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
-
-            # left bottom grid
-            if i == 5:
-                grid_x = current_grid.grid_x - self.map._discrete_x
-                grid_y = current_grid.grid_y - self.map._discrete_y
-                if self.is_obstacle(grid_x, grid_y):
-                    continue
-                # check the grid whether in the map
-                if grid_x >= self.map.boundary[0] and \
-                   grid_y >= self.map.boundary[2]:
-                    priority = current_grid.distance + 14
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
-
-            # bottom grid
-            if i == 6:
-                grid_x = current_grid.grid_x
-                grid_y = current_grid.grid_y - self.map._discrete_y
-                if self.is_obstacle(grid_x, grid_y):
-                    continue
-                # check the grid whether in the map
-                if grid_y >= self.map.boundary[2]:
-                    priority = current_grid.distance + 10
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
-
-            # right bottom grid
-            if i == 7:
-                grid_x = current_grid.grid_x + self.map._discrete_x
-                grid_y = current_grid.grid_y - self.map._discrete_y
-                if self.is_obstacle(grid_x, grid_y):
-                    continue
-                # check the grid whether in the map
-                if grid_x <= self.map.boundary[1] and \
-                   grid_y >= self.map.boundary[2]:
-                    priority = current_grid.distance + 14
-                    self.add_grid_to_openlist(gridx=grid_x, gridy=grid_y,
-                                              priority=priority,
-                                              father_id=current_grid.grid_id)
+                priority = self.distance[grid_id] + \
+                    (14 if delta_x != 0 and delta_y != 0 else 10)
+                self.add_grid_to_openlist(next_x * self.y_num + next_y, priority)
 
     # run this function to get the heuristic value
     def compute_path(self, node_x, node_y):
         '''
-        input:  the current node in park map 
-        return: the heuristic value and the closedlist
-        Note:   closedlist contains the info(mainly distance) 
-                about those grid has been explored
+        input:  the current node in park map
+        return: the heuristic value and the distance table
+        Note:   the search continues from the previous call until the grid
+                of the node is settled, the distance table contains the
+                distance of the settled grids (indexed by grid id),
+                inf is returned if the grid can not be reached
         '''
-        # initial map
-        self.find_terminate = False
-        current_grid = self.initial_map(node_x, node_y)
-        while not self.find_terminate:
+        x_index, y_index = self.locate_grid(node_x, node_y)
+        terminate_grid_id = x_index * self.y_num + y_index
+        while not self.settled[terminate_grid_id]:
+            current_grid_id = self.update_closedlist()
+            if current_grid_id is None:
+                return np.inf, self.distance
             # expand grid and update openlist
-            self.update_openlist(current_grid)
-            # get the next grid
-            current_grid = self.update_closedlist()
+            self.update_openlist(current_grid_id)
 
-        return current_grid.distance, self.closedlist
+        return self.distance[terminate_grid_id], self.distance
 
-    def add_grid_to_openlist(self, gridx, gridy, priority, father_id):
-        index = self.map.convert_position_to_index(gridx, gridy)
-        # check this grid is firstly visited or not
-        # if it exits, change its value
-        if self.openlist_index.count(index):
-            # find the previous priority
-            for i in range(self.open_list.queue.__len__()):
-                if self.open_list.queue[i].grid_id == index:
-                    pre_priority = self.open_list.queue[i].distance
-                    if pre_priority > priority:
-                        self.open_list.queue[i].distance = priority
-                        self.open_list.queue[i].father_id = father_id
-                    break
-        else:
-            grid_node = Grid(grid_id=index, grid_x=gridx,
-                             grid_y=gridy, distance=priority,
-                             father_id=father_id)
+    def add_grid_to_openlist(self, grid_id, priority):
+        # check whether a shorter distance is known
+        if self.settled[grid_id]:
+            return
+        if priority < self.distance[grid_id]:
+            self.distance[grid_id] = priority
+            heapq.heappush(self.open_list, (priority, grid_id))
 
-            self.open_list.put(grid_node)
-            self.openlist_index.append(index)
-
-    def is_obstacle(self, grid_x, grid_y):
-        # check collision
+    def compute_field(self):
+        '''
+        run one 8-connected wavefront from the final point over the whole map
+        return: the distance from the final point to each grid (float32, the
+                shape is the same as cost_map), inf for unreachable grids
+        Note:   the same costs as compute_path are used, 10 for a straight
+                step and 14 for a diagonal step, a step is only allowed into
+                a free grid
+        '''
+        x_num, y_num = self.map.grid_shape
+        grid_id = np.arange(x_num * y_num).reshape(x_num, y_num)
+        # unpacked only while the graph is built
+        free = ~self.map.occupancy_grid()
+
+        source = []
+        target = []
+        weight = []
+        for delta_x in (-1, 0, 1):
+            for delta_y in (-1, 0, 1):
+                if delta_x == 0 and delta_y == 0:
+                    continue
+                # grids whose neighbor (delta_x, delta_y) is in the map
+                from_x = slice(max(-delta_x, 0), x_num - max(delta_x, 0))
+                from_y = slice(max(-delta_y, 0), y_num - max(delta_y, 0))
+                to_x = slice(max(delta_x, 0), x_num - max(-delta_x, 0))
+                to_y = slice(max(delta_y, 0), y_num - max(-delta_y, 0))
+                step = free[to_x, to_y]
+                source.append(grid_id[from_x, from_y][step])
+                target.append(grid_id[to_x, to_y][step])
+                cost = 14 if delta_x != 0 and delta_y != 0 else 10
+                weight.append(np.full(np.count_nonzero(step), cost, dtype=np.float64))
+
+        graph = sparse.csr_matrix((np.concatenate(weight),
+                                   (np.concatenate(source), np.concatenate(target))),
+                                  shape=(x_num * y_num, x_num * y_num))
+        initial_x, initial_y = self.locate_grid(self.final_point[0], self.final_point[1])
+        distance = csgraph.dijkstra(graph, directed=True,
+                                    indices=grid_id[initial_x, initial_y])
+        self.field = distance.reshape(x_num, y_num).astype(np.float32)
+
+        return self.field
+
+    def locate_grid(self, grid_x, grid_y):
+        '''
+        param: the position in the park map
+        return: the index of the grid in cost_map
+        '''
         x_index = math.floor(
             (grid_x - self.map.boundary[0]) / self.map._discrete_x)
         y_index = math.floor(
             (grid_y - self.map.boundary[2]) / self.map._discrete_y)
-        # print(f"{self.map.boundary[0]}, {self.map.boundary[1]}, {self.map.boundary[2]}, {self.map.boundary[3]}")
-        # print(f"max x value: {self.map.boundary[1]}  max x index: {round((self.map.boundary[1] - self.map.boundary[0]) / self.map._discrete_x)}")
-        # print(f"next x value: {grid_x} next x index: {x_index}")
-        # print(f"_discrete_x: {self.map._discrete_x}")
-        # print(f"({self.map.boundary[1]} - {self.map.boundary[0]}) / {self.map._discrete_x} = {round((self.map.boundary[1] - self.map.boundary[0]) / self.map._discrete_x)}")
         max_x_index = math.ceil(
             (self.map.boundary[1] - self.map.boundary[0]) / self.map._discrete_x)
         max_y_index = math.ceil(
             (self.map.boundary[3] - self.map.boundary[2]) / self.map._discrete_y)
-        # print(max_x_index)
         if x_index == max_x_index:
             x_index = max_x_index - 1
         if y_index == max_y_index:
             y_index = max_y_index - 1
-        is_obstacle = False
-        if int(self.map.cost_map[x_index][y_index]) == 255:
-            is_obstacle = True
 
-        return is_obstacle
+        return x_index, y_index
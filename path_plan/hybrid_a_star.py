@@ -11,12 +11,15 @@ Copyright (c) 2022 by wenqing-hnu, All Rights Reserved.
 
 import numpy as np
 import math
-import queue
+import heapq
+from collections import OrderedDict
+from typing import List
 from map.costmap import Map, Vehicle
 from collision_check import collision_check
 from path_plan.compute_h import Dijkstra
 from path_plan import rs_curve
-from animation.animation import *
+from path_plan.rs_table import RSLengthTable
+from animation.visual_sink import NullSink
 
 
 class Node:
@@ -30,8 +33,14 @@ class Node:
                 is forward: true or false
                 steering angle: rad
                 f,g,h value
+    Note: the node is only a light handle used while it is searched,
+          the data needed for backtracking is kept in NodeStore
     '''
 
+    __slots__ = ('index', 'grid_index', 'x', 'y', 'theta', 'parent_index',
+                 'child_index', 'in_open', 'in_closed', 'forward',
+                 'steering_angle', 'h', 'g', 'f')
+
     def __init__(self,
                  index: np.int32 = None,
                  grid_index: np.int32 = None,
@@ -62,23 +71,151 @@ class Node:
 
     def __lt__(self, other):
         '''
-        revise compare function for PriorityQueue
+        revise compare function for the open list heap,
+        ties on f are broken by h and then by node index
+        '''
+        if self.f != other.f:
+            return self.f < other.f
+        if self.h != other.h:
+            return self.h < other.h
+        self_index = -1 if self.index is None else self.index
+        other_index = -1 if other.index is None else other.index
+        return self_index < other_index
+
+
+class NodeStore:
+    '''
+    array backed storage of the searched nodes, parallel arrays of
+    x, y, theta, g, h, parent, gear and steer, the node index is the row.
+    parent is -1 for a root node, gear is 1 (forward), -1 (backward)
+    or 0 (unknown)
+    '''
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.size = 0
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.theta = np.zeros(capacity, dtype=np.float64)
+        self.g = np.zeros(capacity, dtype=np.float64)
+        self.h = np.zeros(capacity, dtype=np.float64)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.gear = np.zeros(capacity, dtype=np.int8)
+        self.steer = np.zeros(capacity, dtype=np.float64)
+
+    def grow(self) -> None:
+        '''
+        double the capacity of all arrays
+        '''
+        capacity = len(self.x)
+        for name in ('x', 'y', 'theta', 'g', 'h', 'steer', 'gear'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate(
+                (array, np.zeros(capacity, dtype=array.dtype))))
+        self.parent = np.concatenate(
+            (self.parent, np.full(capacity, -1, dtype=np.int64)))
+
+    def add(self, node: Node) -> int:
+        '''
+        store the node and return its index
+        '''
+        if self.size == len(self.x):
+            self.grow()
+        index = self.size
+        self.x[index] = node.x
+        self.y[index] = node.y
+        self.theta[index] = node.theta
+        self.size += 1
+        self.update(index, node)
+        return index
+
+    def update(self, index: int, node: Node) -> None:
+        '''
+        update the cost and the parent of a stored node
+        '''
+        self.g[index] = node.g
+        self.h[index] = node.h
+        self.parent[index] = -1 if node.parent_index is None else node.parent_index
+        if node.forward is None:
+            self.gear[index] = 0
+        else:
+            self.gear[index] = 1 if node.forward else -1
+        self.steer[index] = 0 if node.steering_angle is None else node.steering_angle
+
+    def backtrack(self, index: int) -> np.ndarray:
+        '''
+        return: node indexes from the given node to its root node
+        '''
+        path_index = [index]
+        parent = self.parent[index]
+        while parent >= 0:
+            path_index.append(parent)
+            parent = self.parent[parent]
+        return np.array(path_index, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class OpenList:
+    '''
+    open list of hybrid a star: a heapq ordered by f and a dict keyed by
+    the node state (grid index, heading), so a queued node is found in O(1).
+    Decrease-key pushes a new heap entry, the outdated entry is dropped
+    when it is popped (lazy deletion).
+    '''
+
+    def __init__(self) -> None:
+        self.heap = []
+        self.nodes = {}
+
+    def put(self, node: Node) -> None:
+        self.nodes[(node.grid_index, node.theta)] = node
+        heapq.heappush(self.heap, (node.f, node))
+
+    def decrease_key(self, node: Node) -> None:
+        '''
+        call it after the f value of a queued node is reduced
         '''
-        result = False
-        if self.f < other.f:
-            result = True
-        return result
+        heapq.heappush(self.heap, (node.f, node))
+
+    def find(self, state_key) -> Node:
+        return self.nodes.get(state_key)
+
+    def get(self) -> Node:
+        while self.heap:
+            f, node = heapq.heappop(self.heap)
+            state_key = (node.grid_index, node.theta)
+            # skip the outdated entries
+            if f == node.f and self.nodes.get(state_key) is node:
+                del self.nodes[state_key]
+                return node
+        raise IndexError('get from an empty open list')
+
+    def empty(self) -> bool:
+        return len(self.nodes) == 0
+
+    def clear(self) -> None:
+        self.heap.clear()
+        self.nodes.clear()
+
+    def __len__(self) -> int:
+        return len(self.nodes)
 
 
 class hybrid_a_star:
     def __init__(self,
                  config: dict,
                  park_map: Map,
-                 vehicle: Vehicle) -> None:
+                 vehicle: Vehicle,
+                 sink=None,
+                 collision_checker=None) -> None:
 
         # create vehicle
         self.vehicle = vehicle
 
+        # visualization of the searching process, nothing is drawn by default
+        self.sink = sink if sink is not None else NullSink()
+
         # discrete steering angle
         self.steering_angle = np.linspace(- self.vehicle.max_steering_angle,
                                           self.vehicle.max_steering_angle,
@@ -89,21 +226,47 @@ class hybrid_a_star:
 
         # caculate heuristic and store h value
         self.heuristic = Dijkstra(park_map)
-        _, self.h_value_list = self.heuristic.compute_path(
-            node_x=park_map.case.x0, node_y=park_map.case.y0)
+        self.heuristic_mode = config['heuristic_mode']
+        if self.heuristic_mode == 'field':
+            # distance from the goal to every grid, computed once
+            if park_map.heuristic_field is None:
+                park_map.heuristic_field = self.heuristic.compute_field()
+            self.h_field = park_map.heuristic_field
+        else:
+            self.heuristic.compute_path(
+                node_x=park_map.case.x0, node_y=park_map.case.y0)
+
+        # rs curve length for the heuristic: 'exact' or 'lut' (lookup table)
+        self.rs_heuristic = config['rs_heuristic']
+        if self.rs_heuristic == 'lut':
+            self.rs_table = RSLengthTable(vehicle=vehicle, config=config)
+
+        # LRU cache of the analytic expansion results, keyed by the
+        # quantized start pose and the goal index
+        self.rs_cache = OrderedDict()
+        self.rs_cache_size = config['rs_cache_size']
+        self.rs_cache_resolution = config['rs_cache_resolution']
+        self.rs_cache_heading = 2 * np.pi / config['rs_cache_heading_num']
+        self.rs_cache_hit = 0
+        self.rs_cache_miss = 0
+        # how many rs words are tried for each goal, shortest first
+        self.rs_candidate_num = config['rs_candidate_num']
 
         # default settings
-        self.global_index = 0
         self.config = config
-        self.open_list = queue.PriorityQueue()
-        self.closed_list = []
+        self.open_list = OpenList()
+        # closed set keyed by discretized state (grid index, heading)
+        self.closed_set = set()
+        # all generated nodes, parent lookups go through this store
+        self.node_store = NodeStore()
+        # nodes popped from the open list and expanded by the search
+        self.expanded_num = 0
         self.dt = config['dt']
         self.ddt = config['trajectory_dt']
 
         # initial node
         self.initial_node = Node(x=park_map.case.x0,
                                  y=park_map.case.y0,
-                                 index=0,
                                  grid_index=park_map.convert_position_to_index(park_map.case.x0, park_map.case.y0),
                                  theta=rs_curve.pi_2_pi(park_map.case.theta0))
         # final node
@@ -111,15 +274,25 @@ class hybrid_a_star:
                               y=park_map.case.yf,
                               grid_index=park_map.convert_position_to_index(park_map.case.xf, park_map.case.yf),
                               theta=rs_curve.pi_2_pi(park_map.case.thetaf))
+        self.initial_node.index = self.node_store.add(self.initial_node)
+        self.goal_node.index = self.node_store.add(self.goal_node)
+
+        # relative motion of the children, computed once
+        self.build_motion_primitives()
 
         # max delta heading
         self.max_delta_heading = self.vehicle.max_v * \
             np.tan(self.vehicle.max_steering_angle) / self.vehicle.lw * self.dt
 
-        # create collision checker
-        if self.config['collision_check'] == 'circle':
+        # create collision checker, a shared one keeps the cspace bins built once
+        if collision_checker is not None:
+            self.collision_checker = collision_checker
+        elif self.config['collision_check'] == 'circle':
             self.collision_checker = collision_check.two_circle_checker(
                 vehicle=self.vehicle, map=self.park_map, config=config)
+        elif self.config['collision_check'] == 'cspace':
+            self.collision_checker = collision_check.cspace_checker(
+                vehicle=self.vehicle, map=self.park_map, config=config)
         else:
             self.collision_checker = collision_check.distance_checker(
                 vehicle=self.vehicle, map=self.park_map, config=config)
@@ -129,129 +302,75 @@ class hybrid_a_star:
         if self.goal_list_mode:
             self.open_list.put(self.goal_node)
             self.goal_node_list = self.create_goal_node_list(config['goal_list_size'])
-            self.open_list.queue.clear()
+            self.open_list.clear()
             assert self.open_list.empty()
         else:
             self.goal_node_list = [self.goal_node]
             assert len(self.goal_node_list) == 1
-            ploter.plot_obstacles(self.park_map)
+            self.sink.plot_obstacles(self.park_map)
 
         self.open_list.put(self.initial_node)
         self.initial_node.in_open = True
 
     def create_goal_node_list(self, step_num):
-        ploter.plot_obstacles(self.park_map)
+        self.sink.plot_obstacles(self.park_map)
         goal_node_list = []
         for i in range(step_num):
             if self.open_list.empty():
                 break
             current_node = self.open_list.get()
             goal_node_list.append(current_node)
-            ploter.plot_goal_node(current_node)
+            self.sink.plot_goal_node(current_node)
             child_group = self.expand_node(current_node, True)
         return goal_node_list
 
 
     def expand_node(self,
                     current_node: Node,
-                    finding_goal_list=False) -> queue.PriorityQueue:
+                    finding_goal_list=False) -> List[Node]:
         # caculate <x,y,theta> of the next node
         # next_index = 9 or 10(the first expansion)
-        child_group = queue.PriorityQueue()
+        child_group = []
         next_index = 0
-        travle_distance = 0  # v_max * dt
         next_index = int(2 * self.config['steering_angle_num'])
+        # poses of all children and their collision check points
+        child_poses = self.transform_primitives(
+            current_node, self.primitive_end).tolist()
+        step_poses = self.transform_primitives(
+            current_node, self.primitive_steps)
+        # the firstly visited children, they need collision check
+        new_children = {}
         for i in range(next_index):
             # caculate steering angle and gear
-            steering_angle = self.steering_angle[i %
-                                                 self.config['steering_angle_num']]
-            if i < next_index / 2:
-                speed = self.vehicle.max_v
-                is_forward = True
-            else:
-                speed = - self.vehicle.max_v
-                is_forward = False
-
-            travle_distance = speed * self.dt
-            theta_ = current_node.theta + \
-                (self.vehicle.max_v * np.tan(steering_angle)) / \
-                self.vehicle.lw * self.dt
-            theta_ = rs_curve.pi_2_pi(theta_)
-            x_ = current_node.x + travle_distance * np.cos(theta_)
-            y_ = current_node.y + travle_distance * np.sin(theta_)
-
-            # if the node is in closedlist or this node beyond the boundary, continue
-            find_closednode = False
-            for closednode_i in self.closed_list:
-                if closednode_i.grid_index == self.park_map.convert_position_to_index(x_, y_) and abs(closednode_i.theta - theta_) == 0:
-                    # print(abs(closednode_i.theta - theta_))
-                    find_closednode = True
-                    break
-                # if beyond the boundary
-                elif x_ > self.park_map.boundary[1] or x_ < self.park_map.boundary[0] or \
-                        y_ > self.park_map.boundary[3] or y_ < self.park_map.boundary[2]:
-                    find_closednode = True
-                    break
-            if find_closednode == True:
+            steering_angle = self.primitive_steering[i]
+            is_forward = bool(self.primitive_forward[i])
+            x_, y_, theta_ = child_poses[i]
+
+            # if this node beyond the boundary, continue
+            if x_ > self.park_map.boundary[1] or x_ < self.park_map.boundary[0] or \
+                    y_ > self.park_map.boundary[3] or y_ < self.park_map.boundary[2]:
                 continue
-            else:
-                find_opennode = False
-                # find node in the open list
-                for opennode_i in self.open_list.queue:
-                    # if opennode_i.x == x_ and opennode_i.y == y_ and opennode_i.theta == theta_:
-                    if opennode_i.grid_index == self.park_map.convert_position_to_index(x_, y_) and abs(opennode_i.theta - theta_) == 0:
-                        # print(abs(opennode_i.theta - theta_))
-                        child_node = opennode_i
-                        find_opennode = True
+
+            # if the node is in closedlist, continue
+            grid_index = self.park_map.convert_position_to_index(x_, y_)
+            state_key = (grid_index, theta_)
+            if state_key in self.closed_set or state_key in new_children:
+                continue
+
+            # find node in the open list
+            child_node = self.open_list.find(state_key)
 
             # if the node is firstly visited
-            if find_opennode == False:
+            if child_node is None:
                 # generate new node
                 child_node = Node(x=x_,
                                   y=y_,
                                   theta=theta_,
-                                  index=self.global_index + i + 1,
-                                  grid_index=self.park_map.convert_position_to_index(x_, y_),
+                                  grid_index=grid_index,
                                   parent_index=current_node.index,
                                   is_forward=is_forward,
                                   steering_angle=steering_angle)
-                # draw on map
-                ploter.plot_child_node(child_node)
-                # collision check
-                for i in range(math.ceil(self.dt / self.ddt)):
-                    # discrete trajectory for collision check
-                    # i : 0-9
-                    travle_distance_i = speed * self.ddt * (i+1)
-                    theta_i = current_node.theta + \
-                        (self.vehicle.max_v * np.tan(steering_angle)) / \
-                        self.vehicle.lw * self.ddt * (i+1)
-                    theta_i = rs_curve.pi_2_pi(theta_i)
-                    x_i = current_node.x + travle_distance_i * np.cos(theta_i)
-                    y_i = current_node.y + travle_distance_i * np.sin(theta_i)
-
-                    # collision check
-                    collision = self.collision_checker.check(
-                        node_x=x_i, node_y=y_i, theta=theta_i)
-
-                    if collision:
-                        # put the node into the closedlist
-                        self.closed_list.append(child_node)
-                        child_node.in_closed = True
-                        break
-
-                if not collision:
-                    # caculate cost
-                    child_node.g = self.calc_node_cost(
-                        child_node, father_theta=current_node.theta, father_gear=current_node.forward)
-                    # print(f"cost: {child_node.g}")
-                # caculate heuristic
-                    child_node.h = self.calc_node_heuristic(child_node, finding_goal_list)
-                    # print(f"heuristic: {child_node.h}")
-                # caculate f value
-                    child_node.f = child_node.g + child_node.h
-                # add this node into openlist
-                    self.open_list.put(child_node)
-                    child_node.in_open = True
+                new_children[state_key] = (i, child_node)
 
             # if this node has been explored
             else:
@@ -266,18 +385,112 @@ class hybrid_a_star:
                     child_node.parent_index = current_node.index
                     child_node.forward = is_forward
                     child_node.steering_angle = steering_angle
-            if child_node.in_closed == False and child_node.in_open == True:
-                child_group.put(child_node)
+                    self.node_store.update(child_node.index, child_node)
+                    self.open_list.decrease_key(child_node)
+                    # the updated node is pushed into the open list again
+                    self.sink.plot_child_node(child_node)
+                if child_node.in_closed == False and child_node.in_open == True:
+                    child_group.append(child_node)
+
+        if len(new_children) > 0:
+            # collision check the trajectories of all new children at once
+            primitive_index = [i for i, _ in new_children.values()]
+            check_poses = step_poses[primitive_index].reshape(-1, 3)
+            collision = self.collision_checker.check_many(check_poses)
+            collision = collision.reshape(len(primitive_index), -1)
+            check_poses = check_poses.reshape(len(primitive_index), -1, 3)
+
+            free_children = []
+            for k, (_, child_node) in enumerate(new_children.values()):
+                if np.any(collision[k]):
+                    # put the node into the closedlist
+                    self.add_to_closed(child_node)
+                    # the first collision position on its trajectory
+                    collision_p = check_poses[k, np.argmax(collision[k])]
+                    self.sink.plot_collision_p(
+                        collision_p[0], collision_p[1], collision_p[2], self.park_map)
+                else:
+                    free_children.append(child_node)
+
+            # caculate heuristic of all free children at once
+            h_values = self.calc_nodes_heuristic(free_children, finding_goal_list)
+            for child_node, h_value in zip(free_children, h_values):
+                # caculate cost
+                child_node.g = self.calc_node_cost(
+                    child_node, father_theta=current_node.theta, father_gear=current_node.forward)
+                child_node.h = float(h_value)
+                # caculate f value
+                child_node.f = child_node.g + child_node.h
+                # add this node into openlist
+                child_node.index = self.node_store.add(child_node)
+                self.open_list.put(child_node)
+                child_node.in_open = True
+                child_group.append(child_node)
+                # draw on map
+                self.sink.plot_child_node(child_node)
 
         # put the current node into closed list
-        current_node.in_closed = True
         current_node.in_open = False
-        self.closed_list.append(current_node)
-
-        self.global_index += next_index
+        self.add_to_closed(current_node)
+        if not finding_goal_list:
+            self.expanded_num += 1
 
         return child_group
 
+    def build_motion_primitives(self) -> None:
+        '''
+        the motion from a node to its children only depends on the steering
+        angle, the gear, dt and trajectory_dt, so we tabulate it once.
+        primitive_end: relative pose (dx, dy, dtheta) of each child in the
+                       parent frame, shape (2 * steering_angle_num, 3)
+        primitive_steps: relative poses of the collision check points,
+                         shape (2 * steering_angle_num, step_num, 3)
+        the first half of the children moves forward, the second half backward
+        '''
+        steering_num = self.config['steering_angle_num']
+        self.primitive_steering = np.concatenate(
+            (self.steering_angle, self.steering_angle))
+        self.primitive_forward = np.arange(2 * steering_num) < steering_num
+        speed = np.where(self.primitive_forward,
+                         self.vehicle.max_v, -self.vehicle.max_v)
+        # heading change per second
+        yaw_rate = (self.vehicle.max_v * np.tan(self.primitive_steering)) / \
+            self.vehicle.lw
+
+        # the vehicle moves along the heading at the end of the motion
+        def relative_pose(time):
+            dtheta = yaw_rate[:, np.newaxis] * time
+            distance = speed[:, np.newaxis] * time
+            return np.stack((distance * np.cos(dtheta),
+                             distance * np.sin(dtheta),
+                             dtheta), axis=-1)
+
+        step_num = math.ceil(self.dt / self.ddt)
+        step_time = self.ddt * np.arange(1, step_num + 1)
+        self.primitive_end = relative_pose(np.array([self.dt]))[:, 0, :]
+        self.primitive_steps = relative_pose(step_time)
+
+    def transform_primitives(self, node: Node, primitives: np.ndarray) -> np.ndarray:
+        '''
+        transform relative poses (..., 3) into the map frame of the node
+        '''
+        cos_theta = math.cos(node.theta)
+        sin_theta = math.sin(node.theta)
+        poses = np.empty_like(primitives)
+        poses[..., 0] = node.x + primitives[..., 0] * cos_theta - \
+            primitives[..., 1] * sin_theta
+        poses[..., 1] = node.y + primitives[..., 0] * sin_theta + \
+            primitives[..., 1] * cos_theta
+        poses[..., 2] = rs_curve.pi_2_pi_array(node.theta + primitives[..., 2])
+        return poses
+
+    def add_to_closed(self, node: Node) -> None:
+        '''
+        register the node state in the closed set
+        '''
+        node.in_closed = True
+        self.closed_set.add((node.grid_index, node.theta))
+
     def calc_node_cost(self, node: Node, father_theta, father_gear) -> np.float64:
         '''
         input: child node
@@ -301,59 +514,88 @@ class hybrid_a_star:
         '''
         We use Dijkstra algorithm and RS curve length to calculate the heuristic value 
         '''
-        # convert node to grid
-        # grid_x = np.float64("%.1f" % (current_node.x + 0.05))
-        # grid_y = np.float64("%.1f" % (current_node.y + 0.05))
-        _grid_id = self.park_map.convert_position_to_index(grid_x=current_node.x,
-                                                           grid_y=current_node.y)
-        h_value = 0
-        find_grid = False
-        for i in range(len(self.h_value_list)):
-            # find_x = self.h_value_list[i].grid_x == grid_x
-            # find_y = self.h_value_list[i].grid_y == grid_y
-            find_id = self.h_value_list[i].grid_id == _grid_id
-            # if find_x and find_y:
-            if find_id:
-                find_grid = True
-                h_value_1 = self.h_value_list[i].distance
-                # print(f"wanted id: {_grid_id}; self.h_value_list[i].grid_id: {self.h_value_list[i].grid_id}")
-                break
-        if find_grid == False:
-            # print("didn't find grid")
-            h_value_1, self.h_value_list = self.heuristic.compute_path(
+        if self.heuristic_mode == 'field':
+            x_index, y_index = self.heuristic.locate_grid(current_node.x, current_node.y)
+            h_value_1 = np.float64(self.h_field[x_index, y_index])
+        else:
+            # resume the search until the grid of the node is settled
+            h_value_1, _ = self.heuristic.compute_path(
                 node_x=current_node.x, node_y=current_node.y)
 
         max_c = 1 / self.vehicle.min_radius_turn
         min_L = -1
-        if finding_goal_list or not self.goal_list_mode:
-            rs_path = rs_curve.calc_optimal_path(sx=current_node.x,
-                                                sy=current_node.y,
-                                                syaw=current_node.theta,
-                                                gx=self.goal_node.x,
-                                                gy=self.goal_node.y,
-                                                gyaw=self.goal_node.theta,
-                                                maxc=max_c)
-            min_L = rs_path.L
+        if self.rs_heuristic == 'lut':
+            if finding_goal_list or not self.goal_list_mode:
+                goal_nodes = [self.goal_node]
+            else:
+                goal_nodes = self.goal_node_list
+            goals = np.array([[goal.x, goal.y, goal.theta] for goal in goal_nodes])
+            min_L = float(np.min(self.rs_table.lookup(
+                [current_node.x, current_node.y, current_node.theta], goals)))
+        elif finding_goal_list or not self.goal_list_mode:
+            min_L = rs_curve.optimal_length(sx=current_node.x,
+                                            sy=current_node.y,
+                                            syaw=current_node.theta,
+                                            gx=self.goal_node.x,
+                                            gy=self.goal_node.y,
+                                            gyaw=self.goal_node.theta,
+                                            maxc=max_c)
         else:
             for goal_node in self.goal_node_list:
-                rs_path = rs_curve.calc_optimal_path(sx=current_node.x,
-                                                    sy=current_node.y,
-                                                    syaw=current_node.theta,
-                                                    gx=goal_node.x,
-                                                    gy=goal_node.y,
-                                                    gyaw=goal_node.theta,
-                                                    maxc=max_c)
-                if min_L < 0 or rs_path.L < min_L:
-                    min_L = rs_path.L
+                rs_L = rs_curve.optimal_length(sx=current_node.x,
+                                               sy=current_node.y,
+                                               syaw=current_node.theta,
+                                               gx=goal_node.x,
+                                               gy=goal_node.y,
+                                               gyaw=goal_node.theta,
+                                               maxc=max_c)
+                if min_L < 0 or rs_L < min_L:
+                    min_L = rs_L
         
         assert min_L >= 0
         h_value_2 = min_L
         h_value_1 = h_value_1 / 100
-        print(f"h_value_2: {h_value_2}  h_value_1: {h_value_1}")
         h_value = max(h_value_1, h_value_2)
 
         return h_value
 
+    def calc_nodes_heuristic(self, nodes: List[Node], finding_goal_list=False) -> np.ndarray:
+        '''
+        heuristic values of many nodes, the rs curve lengths of all
+        nodes and goals are solved in one batch, small batches are
+        solved one by one
+        '''
+        if len(nodes) == 0:
+            return np.zeros(0)
+
+        if self.heuristic_mode == 'field':
+            grid = [self.heuristic.locate_grid(node.x, node.y) for node in nodes]
+            x_index, y_index = zip(*grid)
+            h_value_1 = self.h_field[list(x_index), list(y_index)].astype(np.float64)
+        else:
+            h_value_1 = np.array([self.heuristic.compute_path(node_x=node.x, node_y=node.y)[0]
+                                  for node in nodes])
+
+        if finding_goal_list or not self.goal_list_mode:
+            goal_nodes = [self.goal_node]
+        else:
+            goal_nodes = self.goal_node_list
+        starts = np.array([[node.x, node.y, node.theta] for node in nodes])
+        goals = np.array([[goal.x, goal.y, goal.theta] for goal in goal_nodes])
+        if self.rs_heuristic == 'lut':
+            rs_L = self.rs_table.lookup(starts[:, np.newaxis, :], goals[np.newaxis, :, :])
+        elif len(starts) * len(goals) < rs_curve.BATCH_MIN_PAIRS:
+            rs_L = np.array([[rs_curve.optimal_length(*start, *goal,
+                                                      maxc=1 / self.vehicle.min_radius_turn)
+                              for goal in goals] for start in starts])
+        else:
+            rs_L, _, _ = rs_curve.batch_optimal_paths(starts[:, np.newaxis, :],
+                                                      goals[np.newaxis, :, :],
+                                                      maxc=1 / self.vehicle.min_radius_turn)
+        h_value_2 = np.min(rs_L, axis=1)
+
+        return np.maximum(h_value_1 / 100, h_value_2)
+
     def try_reach_goal(self, current_node: Node) -> bool:
         '''
         if node is near the goal node, we check whether the rs curve could reach it
@@ -378,89 +620,142 @@ class hybrid_a_star:
         '''
         generate rs curve and collision check
         return: rs_path is a class and collision is true or false
+        Note:   a goal whose rs curve collided from a start pose in the same
+                quantized cell and heading bin is skipped without solving,
+                only the collisions are cached (lossy, the exact pose might
+                reach the goal).
+                up to rs_candidate_num words are tried for each goal in the
+                order of length, the first collision free one is used
         '''
-        for goal_node in self.goal_node_list:
+        # generate max curvature based on min turn radius
+        max_c = 1 / self.vehicle.min_radius_turn
+        start = [current_node.x, current_node.y, current_node.theta]
+        # the rs curves to the goals, solved at once for the remaining goals
+        # when the first goal missing in the cache is reached
+        words = segments = None
+        rs_path = None
+        start_key = self.quantize_pose(current_node)
+        for goal_index, goal_node in enumerate(self.goal_node_list):
             # print(f"trying rs curve for reaching ({goal_node.x}, {goal_node.y})")
             collision = False
-            # generate max curvature based on min turn radius
-            max_c = 1 / self.vehicle.min_radius_turn
-            rs_path = rs_curve.calc_optimal_path(sx=current_node.x,
-                                                sy=current_node.y,
-                                                syaw=current_node.theta,
-                                                gx=goal_node.x,
-                                                gy=goal_node.y,
-                                                gyaw=goal_node.theta,
-                                                maxc=max_c)
-
-            # collision check
-            for i in range(len(rs_path.x)):
-                path_x = rs_path.x[i]
-                path_y = rs_path.y[i]
-                path_theta = rs_path.yaw[i]
-                path_theta = rs_curve.pi_2_pi(path_theta)
-                collision = self.collision_checker.check(
-                    node_x=path_x, node_y=path_y, theta=path_theta)
-
-                if collision:
-                    collision_position = [path_x, path_y, path_theta]
+            cache_key = start_key + (goal_index,)
+            cached = self.rs_cache_get(cache_key)
+            if cached is not None:
+                # the path of an earlier goal does not belong to this collision
+                rs_path = None
+                collision = True
+                collision_position = cached
+                continue
+
+            if self.rs_candidate_num > 1:
+                _, candidate_words, candidate_segments = rs_curve.calc_all_words(
+                    sx=current_node.x, sy=current_node.y, syaw=current_node.theta,
+                    gx=goal_node.x, gy=goal_node.y, gyaw=goal_node.theta, maxc=max_c)
+                candidate_words = candidate_words[:self.rs_candidate_num]
+                candidate_segments = candidate_segments[:self.rs_candidate_num]
+            else:
+                if words is None:
+                    solved_index = goal_index
+                    goals = np.array([[goal.x, goal.y, goal.theta]
+                                      for goal in self.goal_node_list[goal_index:]])
+                    _, words, segments = rs_curve.batch_optimal_paths(start, goals, maxc=max_c)
+                candidate_words = [words[goal_index - solved_index]]
+                candidate_segments = [segments[goal_index - solved_index]]
+
+            for word, segment in zip(candidate_words, candidate_segments):
+                rs_path = rs_curve.make_path(sx=current_node.x,
+                                             sy=current_node.y,
+                                             syaw=current_node.theta,
+                                             word=word,
+                                             segments=segment,
+                                             maxc=max_c)
+
+                # collision check, stop at the first collision
+                poses = np.column_stack((rs_path.x, rs_path.y,
+                                         rs_curve.pi_2_pi_array(rs_path.yaw)))
+                collision, collision_position = self.collision_checker.check_trajectory(poses)
+                if not collision:
                     break
-                else:
-                    collision_position = None
             # TODO: if no collision, return current path
-            if collision_position == None:
-                node = goal_node
-                while node.index != self.goal_node.index:
-                    rs_path.x.append(node.x)
-                    rs_path.y.append(node.y)
-                    rs_path.yaw.append(node.theta)
-                    parent_index = node.parent_index
-                    for node_i in self.closed_list:
-                        if node_i.index == parent_index:
-                            node = node_i
-                            break
-                rs_path.x.append(node.x)
-                rs_path.y.append(node.y)
-                rs_path.yaw.append(node.theta)
+            if collision_position is not None:
+                self.rs_cache_put(cache_key, collision_position)
+            else:
+                store = self.node_store
+                for k in store.backtrack(goal_node.index):
+                    rs_path.x.append(float(store.x[k]))
+                    rs_path.y.append(float(store.y[k]))
+                    rs_path.yaw.append(float(store.theta[k]))
                 break
 
         return rs_path, collision, collision_position
 
+    def quantize_pose(self, node: Node) -> tuple:
+        '''
+        the cell and heading bin of the node for the rs cache
+        '''
+        heading_bin = round(rs_curve.pi_2_pi(node.theta) / self.rs_cache_heading)
+        heading_num = round(2 * np.pi / self.rs_cache_heading)
+        return (round(node.x / self.rs_cache_resolution),
+                round(node.y / self.rs_cache_resolution),
+                heading_bin % heading_num)
+
+    def rs_cache_get(self, key: tuple):
+        '''
+        return: the cached collision position of a colliding rs curve,
+                None if missed
+        '''
+        if self.rs_cache_size <= 0:
+            return None
+        value = self.rs_cache.get(key)
+        if value is None:
+            self.rs_cache_miss += 1
+            return None
+        self.rs_cache_hit += 1
+        self.rs_cache.move_to_end(key)
+        return value
+
+    def rs_cache_put(self, key: tuple, value: list) -> None:
+        if self.rs_cache_size <= 0:
+            return
+        self.rs_cache[key] = value
+        self.rs_cache.move_to_end(key)
+        # evict the least recently used results
+        while len(self.rs_cache) > self.rs_cache_size:
+            self.rs_cache.popitem(last=False)
+
+    def rs_cache_info(self) -> dict:
+        total = self.rs_cache_hit + self.rs_cache_miss
+        return {'hit': self.rs_cache_hit,
+                'miss': self.rs_cache_miss,
+                'hit_rate': self.rs_cache_hit / total if total > 0 else 0.0,
+                'size': len(self.rs_cache)}
+
     def finish_path(self, current_node: Node):
-        node = current_node
-        all_path_node = []
-        while node.index != self.initial_node.index:
-            all_path_node.append(node)
-            parent_index = node.parent_index
-            for node_i in self.closed_list:
-                if node_i.index == parent_index:
-                    node = node_i
-                    break
-        all_path_node.append(node)
+        store = self.node_store
+        # node indexes from the initial node to the current node
+        path_index = store.backtrack(current_node.index)[::-1]
 
-        all_path = [[node.x, node.y, node.theta]]
+        k = path_index[0]
+        all_path = [[float(store.x[k]), float(store.y[k]), float(store.theta[k])]]
 
-        for i in range(len(all_path_node)):
-            # k is index
-            k = len(all_path_node) - 1 - i
-            if k == 0:
-                break
+        for parent, child in zip(path_index[:-1], path_index[1:]):
             for j in range(math.ceil(self.dt/self.ddt)):
                 # discrete trajectory to store each waypoint
                 # i : 0-9
-                if all_path_node[k-1].forward:
+                if store.gear[child] > 0:
                     speed = self.vehicle.max_v
                 else:
                     speed = -self.vehicle.max_v
 
                 td_j = speed * self.ddt * (j+1)
-                theta_0 = all_path_node[k].theta
-                steering_angle = all_path_node[k-1].steering_angle
+                theta_0 = float(store.theta[parent])
+                steering_angle = float(store.steer[child])
                 theta_j = theta_0 + \
                     (self.vehicle.max_v * np.tan(steering_angle)) / \
                     self.vehicle.lw * self.ddt * (j+1)
                 theta_j = rs_curve.pi_2_pi(theta_j)
-                x_j = all_path_node[k].x + td_j * np.cos(theta_j)
-                y_j = all_path_node[k].y + td_j * np.sin(theta_j)
+                x_j = float(store.x[parent]) + td_j * np.cos(theta_j)
+                y_j = float(store.y[parent]) + td_j * np.sin(theta_j)
                 all_path.append([x_j, y_j, theta_j])
 
         return all_path
@@ -16,7 +16,7 @@ from scipy import spatial
 from typing import Dict, Tuple, List
 
 from path_plan.hybrid_a_star import hybrid_a_star
-from animation.animation import ploter
+from animation.visual_sink import create_sink
 from map.costmap import Vehicle, Map
 from collision_check import collision_check
 from path_plan.rs_curve import PATH
@@ -26,21 +26,31 @@ class PathPlanner:
     def __init__(self,
                  config: dict = None,
                  map: Map = None,
-                 vehicle: Vehicle = None) -> None:
+                 vehicle: Vehicle = None,
+                 sink=None) -> None:
         self.config = config
         self.map = map
         self.vehicle = vehicle
+        # visualization of the searching process
+        if sink is None:
+            sink = create_sink(config['visual_sink'], config['draw_collision'])
+        self.sink = sink
         if config['collision_check'] == 'circle':
             self.collision_checker = collision_check.two_circle_checker(map=map,
                                                                         vehicle=vehicle,
                                                                         config=config)
+        elif config['collision_check'] == 'cspace':
+            self.collision_checker = collision_check.cspace_checker(map=map,
+                                                                    vehicle=vehicle,
+                                                                    config=config)
         else:
             self.collision_checker = collision_check.distance_checker(map=map,
                                                                       vehicle=vehicle,
                                                                       config=config)
 
         self.planner = hybrid_a_star(
-            config=config, park_map=map, vehicle=vehicle)
+            config=config, park_map=map, vehicle=vehicle, sink=self.sink,
+            collision_checker=self.collision_checker)
 
     def path_planning(self) -> Tuple[List[List], Dict, List[List[List]]]:
         final_path, astar_path, rs_path = self.a_star_plan()
@@ -69,7 +79,7 @@ class PathPlanner:
 
         reach_goal = False
 
-        # ploter.plot_obstacles(self.map)
+        # self.sink.plot_obstacles(self.map)
 
         while not astar.open_list.empty() and not reach_goal:
             # get current node
@@ -85,9 +95,9 @@ class PathPlanner:
             rs_path, collision, info = astar.try_reach_goal(current_node)
 
             # plot the collision position
-            if collision and self.config['draw_collision']:
+            if collision:
                 collision_p = info['collision_position']
-                ploter.plot_collision_p(
+                self.sink.plot_collision_p(
                     collision_p[0], collision_p[1], collision_p[2], self.map)
 
             if not collision and info['in_radius']:
@@ -97,7 +107,7 @@ class PathPlanner:
 
             else:
                 # expand node
-                ploter.plot_current_node(current_node)
+                self.sink.plot_current_node(current_node)
                 child_group = astar.expand_node(current_node)
                 # path = []
                 # for i in child_group.queue:
@@ -170,28 +180,25 @@ class PathPlanner:
                     have_extended_points = 0
 
                 # extend points
-                for j in range(extend_num):
-                    forward_1 = (final_path[i+1][0] > final_path[i][0]) and (
-                        final_path[i][2] > -np.pi/2 and final_path[i][2] < np.pi/2)
-                    forward_2 = (final_path[i+1][0] < final_path[i][0]) and (
-                        (final_path[i][2] > np.pi/2 and final_path[i][2] < np.pi) or (final_path[i][2] > -np.pi and final_path[i][2] < -np.pi/2))
-                    if forward_1 or forward_2:
-                        speed = self.vehicle.max_v
-                    else:
-                        speed = -self.vehicle.max_v
-
-                    td_j = speed * self.planner.ddt * (j+1)
-                    theta_j = final_path[i+1][2]
-                    x_j = final_path[i+1][0] + td_j * np.cos(theta_j)
-                    y_j = final_path[i+1][1] + td_j * np.sin(theta_j)
-
-                    collision = self.collision_checker.check(node_x=x_j,
-                                                             node_y=y_j,
-                                                             theta=theta_j)
-
-                    if not collision:
-                        input_path.append([x_j, y_j, theta_j])
-                        have_extended_points += 1
+                forward_1 = (final_path[i+1][0] > final_path[i][0]) and (
+                    final_path[i][2] > -np.pi/2 and final_path[i][2] < np.pi/2)
+                forward_2 = (final_path[i+1][0] < final_path[i][0]) and (
+                    (final_path[i][2] > np.pi/2 and final_path[i][2] < np.pi) or (final_path[i][2] > -np.pi and final_path[i][2] < -np.pi/2))
+                if forward_1 or forward_2:
+                    speed = self.vehicle.max_v
+                else:
+                    speed = -self.vehicle.max_v
+
+                theta_j = final_path[i+1][2]
+                td = speed * self.planner.ddt * np.arange(1, extend_num + 1)
+                extend_poses = np.column_stack((final_path[i+1][0] + td * np.cos(theta_j),
+                                                final_path[i+1][1] + td * np.sin(theta_j),
+                                                np.full(extend_num, theta_j)))
+                # every collision free point is kept, check them at once
+                collision = self.collision_checker.check_many(extend_poses)
+                for x_j, y_j, _ in extend_poses[~collision]:
+                    input_path.append([float(x_j), float(y_j), theta_j])
+                    have_extended_points += 1
 
                 split_path.append(input_path)
                 start = i+1
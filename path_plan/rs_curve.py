@@ -23,6 +23,9 @@ This file is surrported by this repo:https://github.com/zhm-real/CurvesGenerator
 STEP_SIZE = 0.5
 MAX_LENGTH = 1000.0
 PI = math.pi
+# below this number of start and goal pairs the scalar optimal_length is
+# faster than batch_optimal_paths
+BATCH_MIN_PAIRS = 8
 
 
 class Arrow:
@@ -117,23 +120,240 @@ def calc_all_paths(sx, sy, syaw, gx, gy, gyaw, maxc, step_size=STEP_SIZE):
     paths = generate_path(q0, q1, maxc)
 
     for path in paths:
-        x, y, yaw, directions = \
-            generate_local_course(path.L, path.lengths,
-                                  path.ctypes, maxc, step_size * maxc)
-
-        # convert global coordinate
-        path.x = [math.cos(-q0[2]) * ix + math.sin(-q0[2])
-                  * iy + q0[0] for (ix, iy) in zip(x, y)]
-        path.y = [-math.sin(-q0[2]) * ix + math.cos(-q0[2])
-                  * iy + q0[1] for (ix, iy) in zip(x, y)]
-        path.yaw = [pi_2_pi(iyaw + q0[2]) for iyaw in yaw]
-        path.directions = directions
-        path.lengths = [l / maxc for l in path.lengths]
-        path.L = path.L / maxc
+        sample_path(path, q0, maxc, step_size)
 
     return paths
 
 
+def sample_path(path, q0, maxc, step_size=STEP_SIZE):
+    """
+    Sample the course of a path with normalized lengths from the start pose q0,
+    the points are converted to global coordinate and the lengths to meters
+    """
+    x, y, yaw, directions = \
+        generate_local_course(path.L, path.lengths,
+                              path.ctypes, maxc, step_size * maxc)
+
+    # convert global coordinate
+    path.x = [math.cos(-q0[2]) * ix + math.sin(-q0[2])
+              * iy + q0[0] for (ix, iy) in zip(x, y)]
+    path.y = [-math.sin(-q0[2]) * ix + math.cos(-q0[2])
+              * iy + q0[1] for (ix, iy) in zip(x, y)]
+    path.yaw = [pi_2_pi(iyaw + q0[2]) for iyaw in yaw]
+    path.directions = directions
+    path.lengths = [l / maxc for l in path.lengths]
+    path.L = path.L / maxc
+
+    return path
+
+
+def optimal_length(sx, sy, syaw, gx, gy, gyaw, maxc):
+    """
+    Length of the shortest Reeds-Shepp path, only the word lengths are
+    evaluated (no sampling, no PATH objects).
+    Return math.inf if no word is feasible
+    """
+    dx = gx - sx
+    dy = gy - sy
+    phi = gyaw - syaw
+    c = math.cos(syaw)
+    s = math.sin(syaw)
+    x = (c * dx + s * dy) * maxc
+    y = (-s * dx + c * dy) * maxc
+    # start of the backwards words
+    xb = x * math.cos(phi) + y * math.sin(phi)
+    yb = x * math.sin(phi) - y * math.cos(phi)
+
+    min_L = MAX_LENGTH
+
+    for yy, pp in ((y, phi), (-y, -phi)):
+        flag, t, u, v = SLS(x, yy, pp)
+        if flag:
+            L = abs(t) + abs(u) + abs(v)
+            if L < min_L:
+                min_L = L
+
+    # word, weight of |u|, length of the fixed arcs, has backwards form
+    for word, u_scale, arc, backwards in LENGTH_WORDS:
+        for xx, yy, pp in ((x, y, phi), (-x, y, -phi),
+                           (x, -y, -phi), (-x, -y, phi)):
+            flag, t, u, v = word(xx, yy, pp)
+            if flag:
+                L = abs(t) + u_scale * abs(u) + abs(v) + arc
+                if L < min_L:
+                    min_L = L
+        if backwards:
+            for xx, yy, pp in ((xb, yb, phi), (-xb, yb, -phi),
+                               (xb, -yb, -phi), (-xb, -yb, phi)):
+                flag, t, u, v = word(xx, yy, pp)
+                if flag:
+                    L = abs(t) + u_scale * abs(u) + abs(v) + arc
+                    if L < min_L:
+                        min_L = L
+
+    if min_L >= MAX_LENGTH:
+        return math.inf
+
+    return min_L / maxc
+
+
+def batch_optimal_paths(starts, goals, maxc):
+    """
+    Shortest Reeds-Shepp words between many start and goal poses.
+    starts and goals are arrays of (x, y, yaw) in the last axis, they are
+    broadcast against each other, e.g. (n, 1, 3) and (1, m, 3)
+    Return lengths (...), words (...) and segments (..., 5):
+        lengths: path length, inf if no word is feasible
+        words: index of the word in RS_WORDS, -1 if no word is feasible
+        segments: signed length of each segment of the word, the unused
+                  segments are 0
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    goals = np.asarray(goals, dtype=np.float64)
+    shape = np.broadcast_shapes(starts.shape, goals.shape)[:-1]
+    starts = np.broadcast_to(starts, shape + (3,))
+    goals = np.broadcast_to(goals, shape + (3,))
+
+    dx = goals[..., 0] - starts[..., 0]
+    dy = goals[..., 1] - starts[..., 1]
+    phi = goals[..., 2] - starts[..., 2]
+    c = np.cos(starts[..., 2])
+    s = np.sin(starts[..., 2])
+    x = (c * dx + s * dy) * maxc
+    y = (-s * dx + c * dy) * maxc
+
+    # the reflections of the goal pose and of the start of the backwards
+    # words, every word is solved on all of them in one pass
+    xb = x * np.cos(phi) + y * np.sin(phi)
+    yb = x * np.sin(phi) - y * np.cos(phi)
+    xs = np.stack((x, -x, x, -x, xb, -xb, xb, -xb))
+    ys = np.stack((y, y, -y, -y, yb, yb, -yb, -yb))
+    phis = np.stack((phi, -phi, -phi, phi) * 2)
+    signs = np.array((1.0, -1.0, 1.0, -1.0)).reshape((4,) + (1,) * len(shape))
+
+    # the segments and flags of all candidates in the order of generate_path,
+    # the shortest one is picked at once
+    all_segments = np.zeros((len(BATCH_CODES), 5) + shape)
+    all_flags = np.zeros((len(BATCH_CODES),) + shape, dtype=bool)
+
+    with np.errstate(all='ignore'):
+        flag, t, u, v = SLS_array(xs[0:3:2], ys[0:3:2], phis[0:3:2])
+        all_flags[0:2] = flag
+        for j, l in enumerate((t, u, v)):
+            all_segments[0:2, j] = l
+        i = 2
+        for word, segments, _, backwards_ctypes in BATCH_WORDS:
+            reflections = 4 if backwards_ctypes is None else 8
+            flag, t, u, v = word(xs[:reflections], ys[:reflections], phis[:reflections])
+            word_segments = segments(t, u, v)
+            all_flags[i:i + 4] = flag[:4]
+            for j, l in enumerate(word_segments):
+                all_segments[i:i + 4, j] = signs * (l[:4] if np.ndim(l) else l)
+            i += 4
+            if backwards_ctypes is None:
+                continue
+            # the backwards words run the segments in the reverse order
+            all_flags[i:i + 4] = flag[4:]
+            for j, l in enumerate(word_segments[::-1]):
+                all_segments[i:i + 4, j] = signs * (l[4:] if np.ndim(l) else l)
+            i += 4
+
+        L = np.sum(np.abs(all_segments), axis=1)
+        L = np.where(all_flags & (L < MAX_LENGTH), L, np.inf)
+
+    # the first candidate is kept on ties, like generate_path
+    index = np.argmin(L, axis=0)[np.newaxis]
+    best_L = np.take_along_axis(L, index, axis=0)[0]
+    found = best_L < np.inf
+    best_word = np.where(found, BATCH_CODES[index[0]], -1)
+    best_segments = np.take_along_axis(all_segments, index[np.newaxis], axis=0)[0]
+    best_segments = np.where(found[..., np.newaxis], np.moveaxis(best_segments, 0, -1), 0.0)
+
+    lengths = np.where(found, best_L / maxc, np.inf)
+    return lengths, best_word, best_segments / maxc
+
+
+def batch_candidates(x, y, phi):
+    """
+    Yield (ctypes, flag, segments) of every word in the order of
+    generate_path, x, y, phi are the normalized goal poses in the start frame
+    """
+    # start of the backwards words
+    xb = x * np.cos(phi) + y * np.sin(phi)
+    yb = x * np.sin(phi) - y * np.cos(phi)
+
+    flag, t, u, v = SLS_array(x, y, phi)
+    yield "SLS", flag, (t, u, v)
+    flag, t, u, v = SLS_array(x, -y, -phi)
+    yield "SRS", flag, (t, u, v)
+
+    for word, segments, ctypes, backwards_ctypes in BATCH_WORDS:
+        # reflections of the word, the second word of ctypes is the mirror
+        for xx, yy, pp, sign, mirror in ((x, y, phi, 1.0, 0), (-x, y, -phi, -1.0, 0),
+                                         (x, -y, -phi, 1.0, 1), (-x, -y, phi, -1.0, 1)):
+            flag, t, u, v = word(xx, yy, pp)
+            yield ctypes[mirror], flag, [sign * l for l in segments(t, u, v)]
+        if backwards_ctypes is None:
+            continue
+        # the backwards words run the segments in the reverse order
+        for xx, yy, pp, sign, mirror in ((xb, yb, phi, 1.0, 0), (-xb, yb, -phi, -1.0, 0),
+                                         (xb, -yb, -phi, 1.0, 1), (-xb, -yb, phi, -1.0, 1)):
+            flag, t, u, v = word(xx, yy, pp)
+            yield backwards_ctypes[mirror], flag, \
+                [sign * l for l in segments(t, u, v)[::-1]]
+
+
+def calc_all_words(sx, sy, syaw, gx, gy, gyaw, maxc):
+    """
+    All distinct feasible words from the start to the goal, sorted by length
+    Return lengths (n,), words (n,) and segments (n, 5) like batch_optimal_paths
+    Several reflections give the same curve, it is kept once (compared by
+    the rounded nonzero segments)
+    """
+    dx = gx - sx
+    dy = gy - sy
+    c = math.cos(syaw)
+    s = math.sin(syaw)
+    x = (c * dx + s * dy) * maxc
+    y = (-s * dx + c * dy) * maxc
+    phi = gyaw - syaw
+
+    lengths, words, segments = [], [], []
+    found = set()
+    with np.errstate(all='ignore'):
+        for ctypes, flag, word_segments in batch_candidates(np.array(x), np.array(y), np.array(phi)):
+            if not flag:
+                continue
+            word_segments = [float(l) for l in word_segments]
+            L = sum([abs(l) for l in word_segments])
+            if L >= MAX_LENGTH:
+                continue
+            key = tuple((c, round(l, 9)) for c, l in zip(ctypes, word_segments)
+                        if round(l, 9) != 0)
+            if key in found:
+                continue
+            found.add(key)
+            lengths.append(L / maxc)
+            words.append(RS_WORDS.index(ctypes))
+            segments.append([l / maxc for l in word_segments] + [0.0] * (5 - len(word_segments)))
+
+    order = np.argsort(lengths, kind='stable')
+    return np.array(lengths)[order], np.array(words, dtype=np.int64)[order], \
+        np.array(segments).reshape(-1, 5)[order]
+
+
+def make_path(sx, sy, syaw, word, segments, maxc, step_size=STEP_SIZE):
+    """
+    Build the sampled PATH of a word found by batch_optimal_paths
+    """
+    assert word >= 0, "no feasible word"
+    ctypes = list(RS_WORDS[word])
+    lengths = [float(l) * maxc for l in segments[:len(ctypes)]]
+    path = PATH(lengths, ctypes, sum([abs(l) for l in lengths]), [], [], [], [])
+
+    return sample_path(path, [sx, sy, syaw], maxc, step_size)
+
+
 def set_path(paths, lengths, ctypes):
     path = PATH([], [], 0.0, [], [], [], [])
     path.ctypes = ctypes
@@ -534,6 +754,158 @@ def CCSCC(x, y, phi, paths):
     return paths
 
 
+# words used by optimal_length, see generate_path for their families
+LENGTH_WORDS = ((LSL, 1.0, 0.0, False),
+                (LSR, 1.0, 0.0, False),
+                (LRL, 1.0, 0.0, True),
+                (LRLRn, 2.0, 0.0, False),
+                (LRLRp, 2.0, 0.0, False),
+                (LRSL, 1.0, 0.5 * PI, True),
+                (LRSR, 1.0, 0.5 * PI, True),
+                (LRSLR, 1.0, PI, False))
+
+
+def M_array(theta):
+    """
+    Element-wise M for numpy arrays
+    """
+    phi = np.mod(theta, 2.0 * PI)
+
+    return np.where(phi > PI, phi - 2.0 * PI, phi)
+
+
+def SLS_array(x, y, phi):
+    phi = M_array(phi)
+    flag = (y != 0.0) & (phi > 0.0) & (phi < PI * 0.99)
+    xd = -y / np.tan(phi) + x
+    t = xd - np.tan(phi / 2.0)
+    u = phi
+    v = np.sign(y) * np.sqrt((x - xd) ** 2 + y ** 2) - np.tan(phi / 2.0)
+
+    return flag, t, u, v
+
+
+def LSL_array(x, y, phi):
+    u = np.hypot(x - np.sin(phi), y - 1.0 + np.cos(phi))
+    t = np.arctan2(y - 1.0 + np.cos(phi), x - np.sin(phi))
+    v = M_array(phi - t)
+
+    return (t >= 0.0) & (v >= 0.0), t, u, v
+
+
+def LSR_array(x, y, phi):
+    u1 = np.hypot(x + np.sin(phi), y - 1.0 - np.cos(phi)) ** 2
+    t1 = np.arctan2(y - 1.0 - np.cos(phi), x + np.sin(phi))
+    u = np.sqrt(u1 - 4.0)
+    t = M_array(t1 + np.arctan2(2.0, u))
+    v = M_array(t - phi)
+
+    return (u1 >= 4.0) & (t >= 0.0) & (v >= 0.0), t, u, v
+
+
+def LRL_array(x, y, phi):
+    u1 = np.hypot(x - np.sin(phi), y - 1.0 + np.cos(phi))
+    t1 = np.arctan2(y - 1.0 + np.cos(phi), x - np.sin(phi))
+    u = -2.0 * np.arcsin(0.25 * u1)
+    t = M_array(t1 + 0.5 * u + PI)
+    v = M_array(phi - t + u)
+
+    return (u1 <= 4.0) & (t >= 0.0) & (u <= 0.0), t, u, v
+
+
+def calc_tauOmega_array(u, v, xi, eta, phi):
+    delta = M_array(u - v)
+    A = np.sin(u) - np.sin(delta)
+    B = np.cos(u) - np.cos(delta) - 1.0
+
+    t1 = np.arctan2(eta * A - xi * B, xi * A + eta * B)
+    t2 = 2.0 * (np.cos(delta) - np.cos(v) - np.cos(u)) + 3.0
+    tau = np.where(t2 < 0, M_array(t1 + PI), M_array(t1))
+    omega = M_array(tau - u + v - phi)
+
+    return tau, omega
+
+
+def LRLRn_array(x, y, phi):
+    xi = x + np.sin(phi)
+    eta = y - 1.0 - np.cos(phi)
+    rho = 0.25 * (2.0 + np.sqrt(xi * xi + eta * eta))
+    u = np.arccos(rho)
+    t, v = calc_tauOmega_array(u, -u, xi, eta, phi)
+
+    return (rho <= 1.0) & (t >= 0.0) & (v <= 0.0), t, u, v
+
+
+def LRLRp_array(x, y, phi):
+    xi = x + np.sin(phi)
+    eta = y - 1.0 - np.cos(phi)
+    rho = (20.0 - xi * xi - eta * eta) / 16.0
+    u = -np.arccos(rho)
+    t, v = calc_tauOmega_array(u, u, xi, eta, phi)
+
+    return (rho >= 0.0) & (rho <= 1.0) & (u >= -0.5 * PI) & \
+        (t >= 0.0) & (v >= 0.0), t, u, v
+
+
+def LRSR_array(x, y, phi):
+    xi = x + np.sin(phi)
+    eta = y - 1.0 - np.cos(phi)
+    rho = np.hypot(-eta, xi)
+    t = np.arctan2(xi, -eta)
+    u = 2.0 - rho
+    v = M_array(t + 0.5 * PI - phi)
+
+    return (rho >= 2.0) & (t >= 0.0) & (u <= 0.0) & (v <= 0.0), t, u, v
+
+
+def LRSL_array(x, y, phi):
+    xi = x - np.sin(phi)
+    eta = y - 1.0 + np.cos(phi)
+    rho = np.hypot(xi, eta)
+    theta = np.arctan2(eta, xi)
+    r = np.sqrt(rho * rho - 4.0)
+    u = 2.0 - r
+    t = M_array(theta + np.arctan2(r, -2.0))
+    v = M_array(phi - 0.5 * PI - t)
+
+    return (rho >= 2.0) & (t >= 0.0) & (u <= 0.0) & (v <= 0.0), t, u, v
+
+
+def LRSLR_array(x, y, phi):
+    xi = x + np.sin(phi)
+    eta = y - 1.0 - np.cos(phi)
+    rho = np.hypot(xi, eta)
+    u = 4.0 - np.sqrt(rho * rho - 4.0)
+    t = M_array(np.arctan2((4.0 - u) * xi - 2.0 * eta, -2.0 * xi + (u - 4.0) * eta))
+    v = M_array(t - phi)
+
+    return (rho >= 2.0) & (u <= 0.0) & (t >= 0.0) & (v >= 0.0), t, u, v
+
+
+# words used by batch_optimal_paths: solver, segments of the word,
+# ctypes of the word and its mirror, ctypes of the backwards word and its mirror
+BATCH_WORDS = ((LSL_array, lambda t, u, v: (t, u, v), ("LSL", "RSR"), None),
+               (LSR_array, lambda t, u, v: (t, u, v), ("LSR", "RSL"), None),
+               (LRL_array, lambda t, u, v: (t, u, v), ("LRL", "RLR"), ("LRL", "RLR")),
+               (LRLRn_array, lambda t, u, v: (t, u, -u, v), ("LRLR", "RLRL"), None),
+               (LRLRp_array, lambda t, u, v: (t, u, u, v), ("LRLR", "RLRL"), None),
+               (LRSL_array, lambda t, u, v: (t, -0.5 * PI, u, v), ("LRSL", "RLSR"), ("LSRL", "RSLR")),
+               (LRSR_array, lambda t, u, v: (t, -0.5 * PI, u, v), ("LRSR", "RLSL"), ("RSRL", "LSLR")),
+               (LRSLR_array, lambda t, u, v: (t, -0.5 * PI, u, -0.5 * PI, v), ("LRSLR", "RLSRL"), None))
+
+# all words, the index is returned by batch_optimal_paths
+RS_WORDS = ("SLS", "SRS", "LSL", "RSR", "LSR", "RSL", "LRL", "RLR", "LRLR", "RLRL",
+            "LRSL", "RLSR", "LRSR", "RLSL", "LSRL", "RSLR", "RSRL", "LSLR",
+            "LRSLR", "RLSRL")
+
+# index in RS_WORDS of every candidate of batch_optimal_paths, in its order
+BATCH_CODES = np.array([RS_WORDS.index(c) for c in ("SLS", "SRS")] +
+                       [RS_WORDS.index(c)
+                        for _, _, ctypes, backwards_ctypes in BATCH_WORDS
+                        for pair in (ctypes, backwards_ctypes) if pair is not None
+                        for c in (pair[0], pair[0], pair[1], pair[1])])
+
+
 def generate_local_course(L, lengths, mode, maxc, step_size):
     point_num = int(L / step_size) + len(lengths) + 3
 
@@ -656,6 +1028,25 @@ def pi_2_pi(theta):
     return theta
 
 
+def pi_2_pi_array(theta):
+    """
+    Element-wise pi_2_pi for numpy arrays
+    """
+    theta = np.array(theta, dtype=np.float64)
+
+    over = theta > PI
+    while np.any(over):
+        theta[over] -= 2.0 * PI
+        over = theta > PI
+
+    under = theta < -PI
+    while np.any(under):
+        theta[under] += 2.0 * PI
+        under = theta < -PI
+
+    return theta
+
+
 def R(x, y):
     """
     Return the polar coordinates (r, theta) of the point (x, y)
@@ -0,0 +1,103 @@
+'''
+Description: lookup table of the rs curve length
+
+The rs curve length only depends on the pose of the goal in the frame of
+the start pose and is symmetric under (y, theta) -> (-y, -theta), so the
+table covers dx in [-range, range], dy in [0, range] and dtheta in [-pi, pi]
+'''
+
+
+import hashlib
+import os
+import numpy as np
+from map.costmap import Vehicle
+from path_plan import rs_curve
+
+
+class RSLengthTable:
+    def __init__(self, vehicle: Vehicle, config: dict) -> None:
+        self.maxc = 1 / vehicle.min_radius_turn
+        self.range = config['rs_table_range']  # m
+        self.resolution = config['rs_table_resolution']  # m
+        self.heading_num = config['rs_table_heading_num']
+        self.x_num = round(2 * self.range / self.resolution) + 1
+        self.y_num = round(self.range / self.resolution) + 1
+        self._discrete_theta = 2 * np.pi / self.heading_num
+
+        key = hashlib.sha1(repr((float(vehicle.min_radius_turn),
+                                 float(self.range),
+                                 float(self.resolution),
+                                 int(self.heading_num))).encode())
+        table_file = os.path.join(config['map_cache_path'],
+                                  'rs_table_' + key.hexdigest()[:16] + '.npy')
+        if os.path.exists(table_file):
+            self.table = np.load(table_file, mmap_mode='r')
+        else:
+            self.table = self.build_table()
+            os.makedirs(config['map_cache_path'], exist_ok=True)
+            temp_file = table_file + '.tmp%d.npy' % os.getpid()
+            np.save(temp_file, self.table)
+            os.replace(temp_file, table_file)
+
+    def build_table(self):
+        '''
+        solve the rs curve from the origin to every grid pose
+        return: the length table, shape (x_num, y_num, heading_num + 1)
+        '''
+        dx = np.linspace(-self.range, self.range, self.x_num)
+        dy = np.linspace(0, self.range, self.y_num)
+        dtheta = np.linspace(-np.pi, np.pi, self.heading_num + 1)
+        goals = np.stack(np.meshgrid(dx, dy, dtheta, indexing='ij'), axis=-1)
+        lengths, _, _ = rs_curve.batch_optimal_paths(np.zeros(3), goals, self.maxc)
+        return lengths.astype(np.float32)
+
+    def lookup(self, starts, goals):
+        '''
+        trilinear interpolation of the rs curve length
+        param: starts and goals are arrays of (x, y, theta) in the last axis,
+               they are broadcast against each other
+        return: the approximate lengths, the poses out of the table are
+                solved exactly
+        '''
+        starts = np.asarray(starts, dtype=np.float64)
+        goals = np.asarray(goals, dtype=np.float64)
+        shape = np.broadcast_shapes(starts.shape, goals.shape)[:-1]
+        starts = np.broadcast_to(starts, shape + (3,))
+        goals = np.broadcast_to(goals, shape + (3,))
+
+        # goal pose in the start frame
+        cos_theta = np.cos(starts[..., 2])
+        sin_theta = np.sin(starts[..., 2])
+        dx = goals[..., 0] - starts[..., 0]
+        dy = goals[..., 1] - starts[..., 1]
+        local_x = cos_theta * dx + sin_theta * dy
+        local_y = -sin_theta * dx + cos_theta * dy
+        local_theta = rs_curve.pi_2_pi_array(goals[..., 2] - starts[..., 2])
+        # mirror the poses with y < 0
+        local_theta = np.where(local_y < 0, -local_theta, local_theta)
+        local_y = np.abs(local_y)
+
+        in_table = (np.abs(local_x) <= self.range) & (local_y <= self.range)
+        index_x = np.clip((local_x + self.range) / self.resolution, 0, self.x_num - 1)
+        index_y = np.clip(local_y / self.resolution, 0, self.y_num - 1)
+        index_theta = np.clip((local_theta + np.pi) / self._discrete_theta, 0, self.heading_num)
+        x_0 = np.minimum(np.floor(index_x).astype(np.int64), self.x_num - 2)
+        y_0 = np.minimum(np.floor(index_y).astype(np.int64), self.y_num - 2)
+        theta_0 = np.minimum(np.floor(index_theta).astype(np.int64), self.heading_num - 1)
+        t_x = index_x - x_0
+        t_y = index_y - y_0
+        t_theta = index_theta - theta_0
+
+        lengths = np.zeros(shape)
+        for corner_x, w_x in ((x_0, 1 - t_x), (x_0 + 1, t_x)):
+            for corner_y, w_y in ((y_0, 1 - t_y), (y_0 + 1, t_y)):
+                for corner_theta, w_theta in ((theta_0, 1 - t_theta), (theta_0 + 1, t_theta)):
+                    lengths += w_x * w_y * w_theta * \
+                        self.table[corner_x, corner_y, corner_theta]
+
+        if not np.all(in_table):
+            exact, _, _ = rs_curve.batch_optimal_paths(starts[~in_table],
+                                                       goals[~in_table], self.maxc)
+            lengths[~in_table] = exact
+
+        return lengths
@@ -0,0 +1,102 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from collision_check import collision_check
+from config import read_config
+from map import costmap
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+case_files = sorted(glob.glob(os.path.join(root, 'BenchmarkCases', '*.csv')))
+
+
+@pytest.fixture(scope='module')
+def config():
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        return read_config.read_config(config_name='config')
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('file', case_files, ids=lambda f: os.path.basename(f)[:-4])
+def test_cspace_start_and_goal_match_exact_check(file, config):
+    park_map = costmap.Map(file=file, discrete_size=config['map_discrete_size'])
+    vehicle = costmap.Vehicle()
+    exact = collision_check.distance_checker(park_map, vehicle, config)
+    cspace = collision_check.cspace_checker(park_map, vehicle, config)
+    case = park_map.case
+    poses = np.array([[case.x0, case.y0, case.theta0],
+                      [case.xf, case.yf, case.thetaf]])
+
+    # a few goals are within the safety margins, the free ones stay free
+    assert np.array_equal(cspace.check_many(poses), exact.check_many(poses))
+
+
+def test_cspace_matches_exact_check(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    vehicle = costmap.Vehicle()
+    exact = collision_check.distance_checker(park_map, vehicle, config)
+    cspace = collision_check.cspace_checker(park_map, vehicle, config)
+    rng = np.random.default_rng(0)
+    boundary = park_map.boundary
+    poses = np.column_stack([rng.uniform(boundary[0], boundary[1], 2000),
+                             rng.uniform(boundary[2], boundary[3], 2000),
+                             rng.uniform(-np.pi, np.pi, 2000)])
+
+    assert np.array_equal(cspace.check_many(poses), exact.check_many(poses))
+
+
+@pytest.mark.parametrize('order', ['sequential', 'bisection', 'clearance'])
+def test_check_empty_trajectory(order, config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    checker = collision_check.distance_checker(park_map, costmap.Vehicle(), config)
+
+    # like a free trajectory, an empty one has no collision position
+    assert checker.check_trajectory([], order=order) == (False, None)
+
+
+def test_distance_check_many_matches_single_groups(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    checker = collision_check.distance_checker(park_map, costmap.Vehicle(), config)
+    rng = np.random.default_rng(1)
+    boundary = park_map.boundary
+    poses = np.column_stack([rng.uniform(boundary[0] - 2, boundary[1] + 2, 300),
+                             rng.uniform(boundary[2] - 2, boundary[3] + 2, 300),
+                             rng.uniform(-np.pi, np.pi, 300)])
+
+    # the clearance filter and the groups do not change the result
+    collision = checker.check_many(poses)
+    assert np.any(collision) and not np.all(collision)
+    assert np.array_equal(collision, [checker.check_many(pose)[0] for pose in poses])
+
+
+def test_check_trajectory_free_and_blocked(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    checker = collision_check.distance_checker(park_map, costmap.Vehicle(), config)
+    case = park_map.case
+    start = np.array([case.x0, case.y0, case.theta0])
+    obstacle = np.array([park_map.obstacle_x[0], park_map.obstacle_y[0], 0.0])
+
+    assert checker.check_trajectory(np.tile(start, (200, 1))) == (False, None)
+    poses = np.vstack((np.tile(start, (150, 1)), obstacle, np.tile(start, (49, 1))))
+    for order in ['sequential', 'bisection', 'clearance']:
+        collision, position = checker.check_trajectory(poses, order=order)
+        assert collision and position == obstacle.tolist()
+
+
+def test_distance_check_matches_check_many(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    checker = collision_check.distance_checker(park_map, costmap.Vehicle(), config)
+    rng = np.random.default_rng(2)
+    boundary = park_map.boundary
+    poses = np.column_stack([rng.uniform(boundary[0], boundary[1], 100),
+                             rng.uniform(boundary[2], boundary[3], 100),
+                             rng.uniform(-np.pi, np.pi, 100)])
+
+    # the single pose check queries the obstacle index with its own AABB square
+    collision = [checker.check(node_x=x, node_y=y, theta=theta) for x, y, theta in poses]
+    assert np.array_equal(collision, checker.check_many(poses))
@@ -0,0 +1,63 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+from config import read_config
+from map import costmap
+from path_plan.compute_h import Dijkstra
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+case_files = sorted(glob.glob(os.path.join(root, 'BenchmarkCases', '*.csv')))
+
+
+@pytest.fixture(scope='module')
+def park_map():
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        config = read_config.read_config(config_name='config')
+    finally:
+        os.chdir(cwd)
+    return costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+
+
+def sample_points(park_map, num, seed=0):
+    rng = np.random.default_rng(seed)
+    boundary = park_map.boundary
+    return np.column_stack([rng.uniform(boundary[0], boundary[1], num),
+                            rng.uniform(boundary[2], boundary[3], num)])
+
+
+def test_field_matches_lazy_search(park_map):
+    field = Dijkstra(park_map).compute_field()
+    assert field.shape == park_map.grid_shape
+
+    heuristic = Dijkstra(park_map)
+    h_values = []
+    for x, y in sample_points(park_map, 20):
+        h_value, _ = heuristic.compute_path(node_x=x, node_y=y)
+        assert field[heuristic.locate_grid(x, y)] == pytest.approx(h_value)
+        h_values.append(h_value)
+    assert np.count_nonzero(np.isfinite(h_values)) > 10
+    # the settled grids of the lazy search agree with the field
+    settled = heuristic.settled.reshape(park_map.grid_shape)
+    distance = heuristic.distance.reshape(park_map.grid_shape)
+    assert np.allclose(field[settled], distance[settled])
+
+
+def test_resumed_search_matches_fresh_search(park_map):
+    resumed = Dijkstra(park_map)
+    for x, y in sample_points(park_map, 10, seed=1):
+        h_value, _ = resumed.compute_path(node_x=x, node_y=y)
+        fresh_value, _ = Dijkstra(park_map).compute_path(node_x=x, node_y=y)
+        assert h_value == fresh_value
+
+    # a settled grid is answered again without changing the table
+    x, y = sample_points(park_map, 1, seed=1)[0]
+    settled_num = np.count_nonzero(resumed.settled)
+    distance = resumed.distance.copy()
+    assert resumed.compute_path(node_x=x, node_y=y)[0] == Dijkstra(park_map).compute_path(x, y)[0]
+    assert np.count_nonzero(resumed.settled) == settled_num
+    assert np.array_equal(resumed.distance, distance)
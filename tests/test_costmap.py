@@ -0,0 +1,100 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+from matplotlib.path import Path
+
+from config import read_config
+from map import costmap
+from path_plan.compute_h import Dijkstra
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+case_files = sorted(glob.glob(os.path.join(root, 'BenchmarkCases', '*.csv')))
+
+
+@pytest.fixture(scope='module')
+def config():
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        return read_config.read_config(config_name='config')
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('file', case_files[:3], ids=lambda f: os.path.basename(f)[:-4])
+def test_filled_obstacles_match_polygons(file, config):
+    edge_map = costmap.Map(file=file, discrete_size=config['map_discrete_size'])
+    filled_map = costmap.Map(file=file, discrete_size=config['map_discrete_size'],
+                             fill_obstacle=True)
+    position_x, position_y = np.meshgrid(*filled_map.map_position, indexing='ij')
+    points = np.column_stack((position_x.ravel(), position_y.ravel()))
+    inside = np.zeros(len(points), dtype=bool)
+    for obstacle in filled_map.case.obs:
+        inside |= Path(obstacle).contains_points(points)
+    inside = inside.reshape(filled_map.grid_shape)
+
+    occupied = filled_map.occupancy_grid()
+    edge = edge_map.occupancy_grid()
+    # the edges are kept and the map points inside the polygons are filled
+    assert not np.any(edge & ~occupied)
+    assert not np.any(inside & ~occupied)
+    assert not np.any(occupied & ~inside & ~edge)
+
+
+def test_bundle_load_equals_fresh_build(config, tmp_path):
+    config = dict(config, map_cache_path=str(tmp_path), map_bit_packed=False)
+    fresh = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'],
+                        fill_obstacle=config['map_fill_obstacle'])
+    built = costmap.Map.load_or_build(case_files[0], config)
+    loaded = costmap.Map.load_or_build(case_files[0], config)
+    assert len(os.listdir(tmp_path)) == 1
+    heuristic_field = Dijkstra(fresh).compute_field()
+
+    for park_map in (built, loaded):
+        assert park_map.grid_shape == fresh.grid_shape
+        assert np.array_equal(park_map.occupancy_grid(), fresh.occupancy_grid())
+        assert np.array_equal(park_map.boundary, fresh.boundary)
+        assert np.array_equal(park_map.map_position[0], fresh.map_position[0])
+        assert np.array_equal(park_map.map_position[1], fresh.map_position[1])
+        assert np.array_equal(park_map.obstacle_x, fresh.obstacle_x)
+        assert np.array_equal(park_map.obstacle_y, fresh.obstacle_y)
+        assert np.array_equal(park_map.distance_field, fresh.distance_field)
+        assert np.array_equal(park_map.heuristic_field, heuristic_field)
+        # the queries read the loaded index
+        query = (-5.0, 5.0, -5.0, 5.0)
+        for result, expected in zip(park_map.query_aabb(*query), fresh.query_aabb(*query)):
+            assert np.array_equal(np.sort(result), np.sort(expected))
+
+
+def test_bundle_key_follows_the_config(config, tmp_path):
+    config = dict(config, map_cache_path=str(tmp_path), map_bit_packed=False)
+    costmap.Map.load_or_build(case_files[0], config)
+    costmap.Map.load_or_build(case_files[0], dict(config, map_fill_obstacle=not config['map_fill_obstacle']))
+
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_packed_occupancy_reads_like_cost_map(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'],
+                           fill_obstacle=True)
+    packed = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'],
+                         fill_obstacle=True, bit_packed=True)
+    assert packed.cost_map is None
+    assert packed.occupancy_bits.nbytes <= park_map.cost_map.nbytes // 8 + packed.grid_shape[0]
+
+    occupied = park_map.occupancy_grid()
+    assert occupied.dtype == bool and np.any(occupied)
+    assert np.array_equal(packed.occupancy_grid(), occupied)
+    x_index, y_index = np.meshgrid(np.arange(park_map.grid_shape[0]),
+                                   np.arange(park_map.grid_shape[1]), indexing='ij')
+    assert np.array_equal(packed.is_occupied(x_index, y_index), occupied)
+    # single grids, the last column is in a partly used byte
+    x, y = np.argwhere(occupied)[-1]
+    assert packed.is_occupied(x, y) and park_map.is_occupied(x, y)
+    assert packed.is_occupied(0, park_map.grid_shape[1] - 1) == occupied[0, -1]
+
+    assert park_map.cost_map.dtype == np.uint8
+    assert park_map.distance_field.dtype == np.float32
+    assert np.array_equal(packed.distance_field, park_map.distance_field)
@@ -0,0 +1,195 @@
+import glob
+import math
+import os
+
+import numpy as np
+import pytest
+
+from config import read_config
+from map import costmap
+from path_plan import rs_curve
+from path_plan.hybrid_a_star import Node, NodeStore, OpenList, hybrid_a_star
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+case_files = sorted(glob.glob(os.path.join(root, 'BenchmarkCases', '*.csv')))
+
+
+@pytest.fixture(scope='module')
+def config():
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        return read_config.read_config(config_name='config')
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope='module')
+def planner(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    return hybrid_a_star(config=config, park_map=park_map, vehicle=costmap.Vehicle())
+
+
+def make_node(index, grid_index, theta, f, h=0.0):
+    node = Node(index=index, grid_index=grid_index, theta=theta)
+    node.f = f
+    node.h = h
+    return node
+
+
+def test_open_list_pops_in_f_order():
+    open_list = OpenList()
+    for index, f in enumerate([3.0, 1.0, 2.0]):
+        open_list.put(make_node(index, index, 0.0, f))
+
+    assert [open_list.get().f for _ in range(3)] == [1.0, 2.0, 3.0]
+    assert open_list.empty()
+    with pytest.raises(IndexError):
+        open_list.get()
+
+
+def test_open_list_ties_broken_by_h_and_index():
+    open_list = OpenList()
+    open_list.put(make_node(2, 2, 0.0, 1.0, h=0.5))
+    open_list.put(make_node(1, 1, 0.0, 1.0, h=0.5))
+    open_list.put(make_node(0, 0, 0.0, 1.0, h=0.9))
+
+    assert [open_list.get().index for _ in range(3)] == [1, 2, 0]
+
+
+def test_open_list_find_by_state():
+    open_list = OpenList()
+    node = make_node(0, 7, 0.5, 1.0)
+    open_list.put(node)
+
+    assert open_list.find((7, 0.5)) is node
+    assert open_list.find((7, 0.0)) is None
+    open_list.get()
+    assert open_list.find((7, 0.5)) is None
+
+
+def test_open_list_decrease_key_drops_outdated_entry():
+    open_list = OpenList()
+    node = make_node(0, 0, 0.0, 5.0)
+    other = make_node(1, 1, 0.0, 3.0)
+    open_list.put(node)
+    open_list.put(other)
+
+    node.f = 1.0
+    open_list.decrease_key(node)
+
+    assert len(open_list) == 2
+    assert open_list.get() is node
+    assert open_list.get() is other
+    # the entry of the old f value is skipped
+    assert open_list.empty()
+    with pytest.raises(IndexError):
+        open_list.get()
+
+
+def test_node_store_grows_and_keeps_the_nodes():
+    store = NodeStore(capacity=2)
+    for k in range(5):
+        node = Node(x=k, y=2 * k, theta=0.1 * k, parent_index=k - 1 if k > 0 else None,
+                    is_forward=k % 2 == 0, steering_angle=0.2)
+        node.g = k
+        node.h = 10 - k
+        assert store.add(node) == k
+
+    assert len(store) == 5
+    assert len(store.x) >= 5
+    assert np.array_equal(store.x[:5], np.arange(5))
+    assert np.array_equal(store.y[:5], 2 * np.arange(5))
+    assert np.array_equal(store.g[:5], np.arange(5))
+    assert np.array_equal(store.parent[:5], [-1, 0, 1, 2, 3])
+    assert np.array_equal(store.gear[:5], [1, -1, 1, -1, 1])
+
+
+def test_node_store_backtrack_follows_updated_parents():
+    store = NodeStore()
+    nodes = [Node(x=k, parent_index=k - 1 if k > 0 else None) for k in range(4)]
+    for node in nodes:
+        node.index = store.add(node)
+
+    assert store.backtrack(3).tolist() == [3, 2, 1, 0]
+    # a cheaper parent is found for the last node
+    nodes[3].parent_index = 0
+    nodes[3].g = 1.0
+    store.update(3, nodes[3])
+    assert store.backtrack(3).tolist() == [3, 0]
+    assert store.g[3] == 1.0
+    assert store.gear[3] == 0
+
+
+def test_motion_primitives_match_the_kinematic_step(planner, config):
+    node = Node(x=3.0, y=-2.0, theta=0.7)
+    children = planner.transform_primitives(node, planner.primitive_end)
+    steps = planner.transform_primitives(node, planner.primitive_steps)
+    v = planner.vehicle
+
+    assert len(children) == 2 * config['steering_angle_num']
+    for i, (x, y, theta) in enumerate(children):
+        speed = v.max_v if planner.primitive_forward[i] else -v.max_v
+        theta_ = rs_curve.pi_2_pi(
+            node.theta + v.max_v * math.tan(planner.primitive_steering[i]) / v.lw * config['dt'])
+        assert theta == pytest.approx(theta_)
+        assert x == pytest.approx(node.x + speed * config['dt'] * math.cos(theta_))
+        assert y == pytest.approx(node.y + speed * config['dt'] * math.sin(theta_))
+    # the last collision check point is the child itself
+    assert np.allclose(steps[:, -1, :], children)
+
+
+@pytest.mark.parametrize('node_num', [1, 30])
+def test_nodes_heuristic_matches_single_node(planner, node_num):
+    # one node is solved by the scalar rs length, 30 nodes in one batch
+    rng = np.random.default_rng(node_num)
+    boundary = planner.park_map.boundary
+    nodes = [Node(x=rng.uniform(boundary[0], boundary[1]),
+                  y=rng.uniform(boundary[2], boundary[3]),
+                  theta=rng.uniform(-np.pi, np.pi)) for _ in range(node_num)]
+
+    h_values = planner.calc_nodes_heuristic(nodes)
+    expected = [planner.calc_node_heuristic(node) for node in nodes]
+    assert np.allclose(h_values, expected)
+
+
+def test_rs_cache_evicts_the_least_recently_used(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    small = hybrid_a_star(config=dict(config, rs_cache_size=2), park_map=park_map,
+                          vehicle=costmap.Vehicle())
+    small.rs_cache_put((0, 0, 0, 0), [1.0, 1.0, 0.0])
+    small.rs_cache_put((1, 0, 0, 0), [2.0, 1.0, 0.0])
+    assert small.rs_cache_get((0, 0, 0, 0)) == [1.0, 1.0, 0.0]
+    small.rs_cache_put((2, 0, 0, 0), [3.0, 1.0, 0.0])
+
+    assert small.rs_cache_get((1, 0, 0, 0)) is None
+    assert small.rs_cache_get((0, 0, 0, 0)) is not None
+    assert small.rs_cache_info() == {'hit': 2, 'miss': 1, 'hit_rate': 2 / 3, 'size': 2}
+
+
+def test_rs_cache_key_quantizes_the_pose(planner):
+    resolution = planner.rs_cache_resolution
+    key = planner.quantize_pose(Node(x=10.0, y=5.0, theta=0.3))
+
+    assert planner.quantize_pose(Node(x=10.0 + 0.4 * resolution, y=5.0, theta=0.3)) == key
+    assert planner.quantize_pose(Node(x=10.0 + resolution, y=5.0, theta=0.3)) != key
+    assert planner.quantize_pose(Node(x=10.0, y=5.0, theta=0.3 + planner.rs_cache_heading)) != key
+    # the headings of pi and -pi share a bin
+    assert planner.quantize_pose(Node(x=10.0, y=5.0, theta=np.pi))[2] == \
+        planner.quantize_pose(Node(x=10.0, y=5.0, theta=-np.pi))[2]
+
+
+def test_rs_cache_hit_skips_the_goal(config):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    searcher = hybrid_a_star(config=config, park_map=park_map, vehicle=costmap.Vehicle())
+    node = searcher.initial_node
+    start_key = searcher.quantize_pose(node)
+    for goal_index in range(len(searcher.goal_node_list)):
+        searcher.rs_cache_put(start_key + (goal_index,), [float(goal_index), 0.0, 0.0])
+
+    rs_path, collision, collision_position = searcher.try_rs_curve(node)
+    # the collision of the last goal, without a path of another goal
+    assert rs_path is None
+    assert collision
+    assert collision_position == [float(len(searcher.goal_node_list) - 1), 0.0, 0.0]
+    assert searcher.rs_cache_info()['miss'] == 0
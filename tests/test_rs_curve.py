@@ -0,0 +1,71 @@
+import math
+
+import numpy as np
+import pytest
+
+from path_plan import rs_curve
+
+maxc = 0.2
+
+
+def random_poses(num, seed=0):
+    rng = np.random.default_rng(seed)
+    poses = rng.uniform(-15, 15, (num, 3))
+    poses[:, 2] = rng.uniform(-np.pi, np.pi, num)
+    return poses
+
+
+def test_optimal_length_of_a_straight_line():
+    theta = 0.5
+    length = rs_curve.optimal_length(1.0, 2.0, theta,
+                                     1.0 + 10.0 * math.cos(theta), 2.0 + 10.0 * math.sin(theta),
+                                     theta, maxc)
+    assert length == pytest.approx(10.0)
+
+
+def test_optimal_length_matches_the_sampled_paths():
+    starts = random_poses(200, seed=0)
+    goals = random_poses(200, seed=1)
+    equal_num = 0
+    for start, goal in zip(starts, goals):
+        length = rs_curve.optimal_length(*start, *goal, maxc)
+        path_length = rs_curve.calc_optimal_path(*start, *goal, maxc).L
+        # generate_path drops some reflections of a word it already has,
+        # so its shortest path may be longer
+        assert length <= path_length + 1e-9
+        equal_num += length == pytest.approx(path_length)
+    assert equal_num > 0.9 * len(starts)
+
+
+def test_batch_lengths_equal_scalar_lengths():
+    starts = random_poses(40, seed=2)
+    goals = random_poses(6, seed=3)
+    lengths, words, segments = rs_curve.batch_optimal_paths(
+        starts[:, np.newaxis, :], goals[np.newaxis, :, :], maxc)
+
+    assert lengths.shape == words.shape == (40, 6)
+    assert segments.shape == (40, 6, 5)
+    for i, start in enumerate(starts):
+        for j, goal in enumerate(goals):
+            assert lengths[i, j] == pytest.approx(rs_curve.optimal_length(*start, *goal, maxc))
+    assert np.allclose(np.sum(np.abs(segments), axis=-1), lengths)
+
+
+def test_batch_word_reaches_the_goal():
+    for start, goal in zip(random_poses(50, seed=4), random_poses(50, seed=5)):
+        length, word, segments = rs_curve.batch_optimal_paths(start, goal, maxc)
+        path = rs_curve.make_path(*start, int(word), segments, maxc)
+
+        assert path.L == pytest.approx(length)
+        assert path.x[-1] == pytest.approx(goal[0], abs=1e-6)
+        assert path.y[-1] == pytest.approx(goal[1], abs=1e-6)
+        assert rs_curve.pi_2_pi(path.yaw[-1] - goal[2]) == pytest.approx(0.0, abs=1e-6)
+
+
+def test_batch_of_one_pair():
+    start, goal = random_poses(2, seed=6)
+    length, word, segments = rs_curve.batch_optimal_paths(start, goal, maxc)
+
+    assert np.ndim(length) == 0 and np.ndim(word) == 0 and segments.shape == (5,)
+    assert length == pytest.approx(rs_curve.optimal_length(*start, *goal, maxc))
+    assert 0 <= word < len(rs_curve.RS_WORDS)
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+from config import read_config
+from map import costmap
+from path_plan import rs_curve
+from path_plan.rs_table import RSLengthTable
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def table_config(tmp_path_factory):
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        config = read_config.read_config(config_name='config')
+    finally:
+        os.chdir(cwd)
+    # a small table keeps the test fast
+    return dict(config, map_cache_path=str(tmp_path_factory.mktemp('rs_table')),
+                rs_table_range=6, rs_table_resolution=0.25, rs_table_heading_num=72)
+
+
+@pytest.fixture(scope='module')
+def table(table_config):
+    return RSLengthTable(vehicle=costmap.Vehicle(), config=table_config)
+
+
+def random_pairs(num, distance, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(-3, 3, (num, 3))
+    starts[:, 2] = rng.uniform(-np.pi, np.pi, num)
+    goals = starts.copy()
+    goals[:, :2] += rng.uniform(-distance, distance, (num, 2))
+    goals[:, 2] = rng.uniform(-np.pi, np.pi, num)
+    return starts, goals
+
+
+def test_lookup_is_close_to_the_exact_length(table):
+    starts, goals = random_pairs(2000, 4.0)
+    exact, _, _ = rs_curve.batch_optimal_paths(starts, goals, table.maxc)
+    error = np.abs(table.lookup(starts, goals) - exact)
+
+    # the length is steep near a few poses, the interpolation is rough there
+    assert np.median(error) < 0.01
+    assert np.percentile(error, 99) < 0.1
+    assert np.max(error) < 1.0
+
+
+def test_lookup_of_grid_poses_and_far_goals_is_exact(table):
+    # mirrored goal (y < 0) on a grid pose of the table
+    goals = np.array([[2.5, -1.25, -np.pi / 2], [-4.0, 3.0, np.pi / 4]])
+    exact, _, _ = rs_curve.batch_optimal_paths(np.zeros(3), goals, table.maxc)
+    assert np.allclose(table.lookup(np.zeros(3), goals), exact, atol=1e-5)
+
+    starts, goals = random_pairs(50, 4.0, seed=1)
+    goals[:, 0] += 20.0
+    exact, _, _ = rs_curve.batch_optimal_paths(starts, goals, table.maxc)
+    assert np.array_equal(table.lookup(starts, goals), exact)
+
+
+def test_table_is_loaded_from_the_cache(table, table_config):
+    files = os.listdir(table_config['map_cache_path'])
+    assert len(files) == 1 and files[0].startswith('rs_table_')
+
+    loaded = RSLengthTable(vehicle=costmap.Vehicle(), config=table_config)
+    assert isinstance(loaded.table, np.memmap)
+    assert np.array_equal(loaded.table, table.table)
@@ -0,0 +1,83 @@
+import glob
+import os
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pytest
+
+from animation import trace_render, visual_sink
+from config import read_config
+from map import costmap
+from path_plan import path_planner
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+case_files = sorted(glob.glob(os.path.join(root, 'BenchmarkCases', '*.csv')))
+
+
+@pytest.fixture(scope='module')
+def config():
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        return read_config.read_config(config_name='config')
+    finally:
+        os.chdir(cwd)
+
+
+def plan(config, sink):
+    park_map = costmap.Map(file=case_files[0], discrete_size=config['map_discrete_size'])
+    planner = path_planner.PathPlanner(config=config, map=park_map,
+                                       vehicle=costmap.Vehicle(), sink=sink)
+    final_path, _, _ = planner.a_star_plan()
+    return planner, final_path
+
+
+def test_create_sink():
+    assert type(visual_sink.create_sink('none')) is visual_sink.NullSink
+    assert type(visual_sink.create_sink('record')) is visual_sink.RecordingSink
+    assert type(visual_sink.create_sink('unknown')) is visual_sink.NullSink
+
+
+def test_sink_does_not_change_the_search(config):
+    planner, final_path = plan(config, visual_sink.NullSink())
+    recorder = visual_sink.RecordingSink()
+    recorded_planner, recorded_path = plan(config, recorder)
+
+    assert final_path is not None
+    assert np.array_equal(final_path, recorded_path)
+    trace = recorder.trace()
+    assert len(trace['expanded']) == recorder.step > 0
+    assert len(trace['inserted']) > 0
+    assert recorded_planner.planner.expanded_num == planner.planner.expanded_num
+
+
+def test_trace_buffer_spans_chunks():
+    buffer = visual_sink.TraceBuffer(chunk_size=4)
+    for k in range(10):
+        buffer.append(k, 2 * k, 0.1 * k, k // 3)
+
+    rows = buffer.to_array()
+    assert len(buffer) == 10
+    assert rows.shape == (10, 4)
+    assert np.array_equal(rows[:, 0], np.arange(10))
+    assert np.array_equal(rows[:, 3], np.arange(10) // 3)
+    assert visual_sink.TraceBuffer().to_array().shape == (0, 4)
+
+
+def test_trace_round_trip_and_render(config, tmp_path):
+    recorder = visual_sink.RecordingSink()
+    planner, _ = plan(config, recorder)
+    trace_file = str(tmp_path / 'trace.npz')
+    recorder.save(trace_file)
+
+    trace = trace_render.load_trace(trace_file)
+    for name, rows in recorder.trace().items():
+        assert np.array_equal(trace[name], rows)
+    # the events are recorded in the order of the steps
+    assert np.all(np.diff(trace['inserted'][:, 3]) >= 0)
+
+    png = str(tmp_path / 'trace.png')
+    gif = str(tmp_path / 'trace.gif')
+    trace_render.render_trace(trace_file, planner.map, save_png=png, save_gif=gif, frame_num=3)
+    assert os.path.getsize(png) > 0 and os.path.getsize(gif) > 0